@@ -0,0 +1,114 @@
+# analysis.py
+#
+# Per-file analysis context.
+# Decodes an audio file once to a mono float32 buffer at a known
+# sample rate and shares that buffer between:
+# - BPM detection
+# - key detection
+# - fingerprinting
+#
+# The buffer is decoded lazily, so files whose tags already carry
+# everything we need are never decoded at all, and files that only
+# need a fingerprint decode just the first 30 seconds.
+
+import librosa
+import numpy as np
+
+from dj_library_manager.fingerprint import FINGERPRINT_SAMPLE_RATE, DECODE_MARGIN_MS
+
+ANALYSIS_SAMPLE_RATE = FINGERPRINT_SAMPLE_RATE
+
+# Bump whenever BPM/key/fingerprint results change, to invalidate
+# the persistent analysis cache
+ANALYZER_VERSION = 4
+
+# Intros and outros are often beatless or off-key; windowed detectors
+# skip this fraction of the track at each end
+EDGE_SKIP_FRACTION = 0.1
+
+
+class AnalysisContext:
+    def __init__(self, filepath: str, sr: int = ANALYSIS_SAMPLE_RATE):
+        self.filepath = filepath
+        self.sr = sr
+        self.decodes = 0
+
+        self._samples = None
+        self._head = None
+        self._failed = False
+
+    # ============================================================
+    # Shared decode buffer
+    # ============================================================
+    def samples(self):
+        """
+        Returns the mono float32 sample buffer, decoding on first use.
+        Returns None if the file can't be decoded.
+        """
+        if self._samples is None and not self._failed:
+            self.decodes += 1
+            try:
+                y, _ = librosa.load(self.filepath, sr=self.sr, mono=True)
+                self._samples = y.astype(np.float32, copy=False)
+            except Exception:
+                self._failed = True
+
+        return self._samples
+
+    def head(self, max_ms: int):
+        """
+        Returns the first `max_ms` milliseconds of audio, or None.
+        Slices the full buffer if it's already decoded; otherwise decodes
+        only the window (plus a margin so resampling matches a full decode).
+        """
+        n = int(self.sr * max_ms / 1000)
+
+        if self._samples is not None:
+            return self._samples[:n]
+
+        if self._head is not None and len(self._head) >= n:
+            return self._head[:n]
+
+        if self._failed:
+            return None
+
+        self.decodes += 1
+        try:
+            y, _ = librosa.load(
+                self.filepath,
+                sr=self.sr,
+                mono=True,
+                duration=(max_ms + DECODE_MARGIN_MS) / 1000,
+            )
+        except Exception:
+            self._failed = True
+            return None
+
+        self._head = y.astype(np.float32, copy=False)
+        return self._head[:n]
+
+
+# ============================================================
+# Analysis windows
+# ============================================================
+def analysis_windows(samples, sr: int, window_seconds: float, max_windows: int,
+                     skip_fraction: float = EDGE_SKIP_FRACTION) -> list:
+    """
+    Picks up to `max_windows` evenly spaced windows of `window_seconds`
+    from the body of the track (intro/outro skipped).
+    Short tracks come back as a single window.
+    """
+    n = len(samples)
+    width = int(window_seconds * sr)
+
+    start = int(n * skip_fraction)
+    end = n - start
+
+    if end - start < width:
+        return [samples]
+
+    if end - start <= width * max_windows:
+        return [samples[start:end]]
+
+    offsets = np.linspace(start, end - width, max_windows).astype(int)
+    return [samples[o:o + width] for o in offsets]
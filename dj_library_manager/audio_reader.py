@@ -15,14 +15,25 @@
 
 # - detects duplicates
 
-# - supports fast-scan mode
+# - supports a tags-only fast scan that queues analysis for later
+# - drains the analysis queue
 
 # - logs events
 
 # - builds scan reports
 
+# - reuses cached analysis for files whose audio hasn't changed
+
+# - streams files from a background directory walk
+
+# - analyzes files in parallel worker processes
+
+import multiprocessing
 import os
+import signal
 import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
 from mutagen import File as MutagenFile
 
 from dj_library_manager.metadata_utils import (
@@ -34,38 +45,42 @@ from dj_library_manager.metadata_utils import (
     extract_genre,
     extract_title,
     extract_artist,
+    extract_quality,
 )
-import librosa
-import numpy as np
 
-KEYS = [
-    "C", "C#", "D", "D#", "E", "F",
-    "F#", "G", "G#", "A", "A#", "B"
-]
+from dj_library_manager.analysis import AnalysisContext, ANALYZER_VERSION
+from dj_library_manager.content_hash import content_hash
+from dj_library_manager.key_detection import estimate_key
+from dj_library_manager.tempo_detection import detect_tempo
+
 
-def detect_bpm(filepath):
+def detect_bpm(analysis: AnalysisContext):
     try:
-        y, sr = librosa.load(filepath, sr=None, mono=True)
-        tempo, _ = librosa.beat.beat_track(y=y, sr=sr)
-        return int(tempo)
+        y = analysis.samples()
+        if y is None:
+            return None
+        tempo = detect_tempo(y, analysis.sr)
+        return int(round(tempo["bpm"])) if tempo else None
     except Exception:
         return None
 
-def detect_key(filepath):
+def detect_key(analysis: AnalysisContext):
     try:
-        y, sr = librosa.load(filepath, sr=None, mono=True)
-        chroma = librosa.feature.chroma_cqt(y=y, sr=sr)
-        chroma_mean = chroma.mean(axis=1)
-        key_index = chroma_mean.argmax()
-        return KEYS[key_index]
+        y = analysis.samples()
+        if y is None:
+            return None
+        estimate = estimate_key(y, analysis.sr)
+        return estimate["key"] if estimate else None
     except Exception:
         return None
 
-from dj_library_manager.fingerprint import generate_fingerprint
+from dj_library_manager.fingerprint import generate_fingerprint, FINGERPRINT_WINDOW_MS
 
 from dj_library_manager.logging_utils import (
     log_added,
+    log_updated,
     log_duplicate,
+    log_moved,
     log_missing_bpm,
     log_missing_key,
     log_missing_genre,
@@ -81,13 +96,19 @@ from dj_library_manager.logging_utils import (
 from dj_library_manager.scan_report import ScanReport
 
 from dj_library_manager.db_upgrade import (
-    get_scanned_file,
-    update_scanned_file,
-    fingerprint_exists,
-    insert_fingerprint,
+    load_scanned_files,
+    get_cached_analysis,
+    load_backfill_files,
+    find_scanned_by_content,
+    load_analysis_queue,
+    remove_from_analysis_queue,
 )
+from dj_library_manager.connection import get_db_path, set_db_path
 
-from dj_library_manager.database import insert_track
+from dj_library_manager.scan_writer import ScanWriter
+from dj_library_manager.scan_session import ScanProgress, find_resumable_session, start_session, set_session_status
+from dj_library_manager.prune import prune_missing_files, is_under
+from dj_library_manager.walker import WalkFeed, FileListFeed, SUPPORTED_EXTENSIONS, is_audio_file, mtime_seconds
 
 
 # ============================================================
@@ -111,93 +132,411 @@ def progress_bar(percent, length=30):
     return "█" * filled + "░" * (length - filled)
 
 
-SUPPORTED_EXTENSIONS = {".mp3", ".wav", ".flac", ".m4a", ".aac"}
+# ============================================================
+# Worker count
+# ============================================================
+def resolve_workers(workers: int | None) -> int:
+    if workers is None:
+        return os.cpu_count() or 1
+    return max(1, workers)
+
+
+def _init_worker(db_path: str):
+    # Ctrl+C is handled by the parent, which cancels the pool
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
 
+    # Workers only read (analysis cache); make sure it's the same database
+    set_db_path(db_path)
 
-def is_audio_file(filepath: str) -> bool:
-    _, ext = os.path.splitext(filepath.lower())
-    return ext in SUPPORTED_EXTENSIONS
+
+def print_progress(filepath: str, current_index: int, feed: WalkFeed, start_time: float):
+    # The walk runs alongside the scan, so the total may still be growing
+    total_files = max(feed.found, current_index)
+
+    # Progress percentage
+    percent = (current_index / total_files) * 100
+
+    # ETA calculation
+    elapsed = time.time() - start_time
+    avg_time = elapsed / current_index
+    remaining = avg_time * (total_files - current_index)
+
+    # Progress bar
+    bar = progress_bar(percent)
+    eta = f"ETA: {remaining:5.1f}s" if feed.done else f"counting… {total_files} found"
+
+    print(
+        f"{Color.CYAN}[{bar}] {percent:5.1f}%{Color.RESET} "
+        f"{Color.BLUE}Scanning:{Color.RESET} {filepath} "
+        f"{Color.YELLOW}| {eta}{Color.RESET}"
+    )
 
 
 # ============================================================
 # SCAN FOLDER (supports fast_mode)
+# fast_mode is the tags-only tier: tracks are stored straight away
+# and anything needing audio analysis goes to the analysis queue.
+# An interrupted scan of the same folder resumes from its checkpoint
+# unless resume=False.
 # ============================================================
-def scan_folder(folder_path: str, fast_mode: bool = False) -> ScanReport:
+def scan_folder(folder_path: str, fast_mode: bool = False, workers: int | None = None,
+                resume: bool = True) -> ScanReport:
     report = ScanReport()
+    workers = resolve_workers(workers)
+
+    # -----------------------------------------
+    # Preload what we already know about this folder
+    # -----------------------------------------
+    scanned = load_scanned_files(folder_path)
+    backfill = load_backfill_files(folder_path)
 
     # -----------------------------------------
-    # Pre-count audio files
+    # Scan session: resume the last unfinished one, or start fresh
     # -----------------------------------------
-    all_files = []
-    for root, _, files in os.walk(folder_path):
-        for file in files:
-            if is_audio_file(file):
-                all_files.append(os.path.join(root, file))
+    session = find_resumable_session(folder_path, fast_mode) if resume else None
 
-    total_files = len(all_files)
-    print(f"\nFound {total_files} audio files.\n")
+    if session:
+        session_id, checkpoint, files_done = session
+        print(f"\nResuming scan of {folder_path} after {files_done} files…\n")
+    else:
+        session_id, checkpoint, files_done = start_session(folder_path, fast_mode), None, 0
+        print(f"\nScanning {folder_path}…\n")
 
-    current_index = 0
-    start_time = time.time()
+    progress = ScanProgress(session_id, checkpoint, files_done)
 
     # -----------------------------------------
-    # Main scanning loop
+    # Stream files from a background walk;
+    # scanning starts before the walk finishes
     # -----------------------------------------
+    feed = WalkFeed(folder_path, start_after=checkpoint)
+
     try:
-        for filepath in all_files:
-            current_index += 1
+        elapsed = run_feed(feed, report, fast_mode, workers, scanned, progress,
+                           moves_root=folder_path, backfill=backfill)
+    except BaseException:
+        set_session_status(session_id, "interrupted")
+        raise
+
+    if elapsed is None:
+        set_session_status(session_id, "interrupted")
+        print("Run the scan again to resume where it stopped.\n")
+        return report
 
-            # Progress percentage
-            percent = (current_index / total_files) * 100
+    set_session_status(session_id, "finished")
+
+    # -----------------------------------------
+    # Drop files deleted since the last scan.
+    # Only after a complete walk: an unseen path is really gone.
+    # -----------------------------------------
+    report.set_pruned(prune_missing_files(folder_path, feed.seen, checkpoint, feed.unreadable))
 
-            # ETA calculation
-            elapsed = time.time() - start_time
-            avg_time = elapsed / current_index
-            remaining = avg_time * (total_files - current_index)
+    # -----------------------------------------
+    # End of scan summary
+    # -----------------------------------------
+    print(f"\nFound {feed.found} audio files.\n")
 
-            # Progress bar
-            bar = progress_bar(percent)
+    mode_label = "Fast Scan" if fast_mode else "Full Scan"
+    if workers > 1:
+        mode_label += f" ({workers} workers)"
+    report.print_summary(mode_label, elapsed)
+    return report
 
-            print(
-                f"{Color.CYAN}[{bar}] {percent:5.1f}%{Color.RESET} "
-                f"{Color.BLUE}Scanning:{Color.RESET} {filepath} "
-                f"{Color.YELLOW}| ETA: {remaining:5.1f}s{Color.RESET}"
-            )
 
-            report.inc_scanned()
+# ============================================================
+# ANALYZE QUEUE
+# Full analysis of files queued by fast scans. Resumable: each
+# file leaves the queue in the flush that stores its results.
+# The fast scan already added them, so they report as updated.
+# ============================================================
+def analyze_queue(workers: int | None = None) -> ScanReport:
+    report = ScanReport()
+    workers = resolve_workers(workers)
 
-            try:
-                process_file(filepath, report, fast_mode)
-            except Exception as e:
-                log_error(filepath, str(e))
-                report.inc_unreadable()
+    entries, missing = [], []
+    for filepath in load_analysis_queue():
+        try:
+            st = os.stat(filepath)
+            entries.append((filepath, st.st_size, st.st_mtime_ns))
+        except OSError:
+            missing.append(filepath)
 
-    except KeyboardInterrupt:
-        print("\nScan cancelled by user.\n")
+    # Files deleted since they were queued
+    remove_from_analysis_queue(missing)
+
+    print(f"\nAnalyzing {len(entries)} queued files…\n")
+
+    # An empty `scanned` map makes every queued file count as changed
+    elapsed = run_feed(FileListFeed(entries), report, False, workers, {})
+    if elapsed is None:
         return report
 
-    # -----------------------------------------
-    # End of scan summary
-    # -----------------------------------------
-    elapsed = time.time() - start_time
-    mode_label = "Fast Scan" if fast_mode else "Full Scan"
+    mode_label = "Queued Analysis"
+    if workers > 1:
+        mode_label += f" ({workers} workers)"
     report.print_summary(mode_label, elapsed)
     return report
 
 
+def run_feed(feed, report: ScanReport, fast_mode: bool, workers: int, scanned: dict[str, int],
+             progress: ScanProgress | None = None, moves_root: str | None = None,
+             backfill: set[str] | None = None) -> float | None:
+    """
+    Scans every file from `feed`. Returns the elapsed time,
+    or None if the user cancelled (finished work is still saved).
+    moves_root: the folder being scanned; paths not seen before are
+    checked for files moved or renamed within it (see moved_away).
+    backfill: unchanged files missing data stored by newer versions.
+    """
+    backfill = backfill or set()
+    start_time = time.time()
+
+    try:
+        with ScanWriter(progress=progress) as writer:
+            if workers > 1:
+                scan_files_parallel(feed, report, fast_mode, workers, start_time, writer, scanned,
+                                    moves_root, backfill)
+            else:
+                scan_files_serial(feed, report, fast_mode, start_time, writer, scanned,
+                                  moves_root, backfill)
+
+    except KeyboardInterrupt:
+        print("\nScan cancelled by user.\n")
+        return None
+
+    finally:
+        feed.stop()
+
+    return time.time() - start_time
+
+
+def scan_files_serial(
+    feed: WalkFeed,
+    report: ScanReport,
+    fast_mode: bool,
+    start_time: float,
+    writer: ScanWriter,
+    scanned: dict[str, int],
+    moves_root: str | None = None,
+    backfill: set[str] = frozenset(),
+):
+    for current_index, (filepath, _, mtime_ns) in enumerate(feed, start=1):
+        print_progress(filepath, current_index, feed, start_time)
+        report.inc_scanned()
+
+        writer.progress.started(filepath)
+
+        last_modified = mtime_seconds(mtime_ns)
+
+        try:
+            if needs_scan(filepath, last_modified, scanned):
+                result = analyze_file(
+                    filepath, fast_mode, last_modified,
+                    moves_root=None if filepath in scanned else moves_root,
+                )
+                store_result(result, report, writer, moves_root)
+            else:
+                report.inc_skipped()
+                if filepath in backfill:
+                    backfill_file(filepath, writer)
+        except Exception as e:
+            log_error(filepath, str(e))
+            writer.analysis_failed(filepath, str(e))
+            report.inc_unreadable()
+
+        # Handled (stored, skipped or failed): the next flush
+        # can move the checkpoint past it
+        writer.progress.finished(filepath)
+        writer.file_done()
+
+
 # ============================================================
-# PROCESS FILE (supports fast_mode)
+# PARALLEL SCAN
+# Workers decode + analyze; this process is the only DB writer.
 # ============================================================
-def process_file(filepath: str, report: ScanReport, fast_mode: bool):
+def scan_files_parallel(
+    feed: WalkFeed,
+    report: ScanReport,
+    fast_mode: bool,
+    workers: int,
+    start_time: float,
+    writer: ScanWriter,
+    scanned: dict[str, int],
+    moves_root: str | None = None,
+    backfill: set[str] = frozenset(),
+):
+    max_in_flight = workers * 4
+
+    files = iter(feed)
+    pending = {}     # future -> (filepath, last_modified, moves_root)
+    lost = []        # jobs in flight when a worker died
+    current_index = 0
+
+    def submit(job):
+        filepath, last_modified, file_moves_root = job
+        return executor.submit(analyze_file, filepath, fast_mode, last_modified, file_moves_root)
+
+    def finish(filepath, future=None, error=None):
+        nonlocal current_index
+        current_index += 1
+        print_progress(filepath, current_index, feed, start_time)
+        report.inc_scanned()
+
+        try:
+            if error is not None:
+                raise RuntimeError(error)
+            store_result(future.result(), report, writer, moves_root)
+        except Exception as e:
+            log_error(filepath, str(e))
+            writer.analysis_failed(filepath, str(e))
+            report.inc_unreadable()
+
+        writer.progress.finished(filepath)
+        writer.file_done()
+
+    executor = _new_pool(workers)
+
+    try:
+        while True:
+            # Keep the pool fed without queueing the whole library
+            while len(pending) < max_in_flight:
+                entry = next(files, None)
+                if entry is None:
+                    break
+
+                filepath, _, mtime_ns = entry
+                last_modified = mtime_seconds(mtime_ns)
+                writer.progress.started(filepath)
+
+                if not needs_scan(filepath, last_modified, scanned):
+                    current_index += 1
+                    print_progress(filepath, current_index, feed, start_time)
+                    report.inc_scanned()
+                    report.inc_skipped()
+                    if filepath in backfill:
+                        backfill_file(filepath, writer)
+                    writer.progress.finished(filepath)
+                    writer.file_done()
+                    continue
+
+                job = (filepath, last_modified, None if filepath in scanned else moves_root)
+                try:
+                    pending[submit(job)] = job
+                except BrokenProcessPool:
+                    lost.append(job)
+                    break
+
+            if not pending and not lost:
+                break
+
+            if pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    job = pending.pop(future)
+
+                    # A dead pool analysed nothing: the file is neither failed
+                    # nor finished, so the checkpoint stays before it
+                    if isinstance(future.exception(), BrokenProcessPool):
+                        lost.append(job)
+                    else:
+                        finish(job[0], future)
+
+            if not lost:
+                continue
+
+            # -----------------------------------------
+            # A worker died (e.g. a decoder crash): every other future
+            # fails with it. Keep what finished, start a new pool and
+            # rerun the lost files one at a time, so only the file that
+            # takes a worker down is marked as failed.
+            # -----------------------------------------
+            wait(pending)
+            for future, job in pending.items():
+                if isinstance(future.exception(), BrokenProcessPool):
+                    lost.append(job)
+                else:
+                    finish(job[0], future)
+            pending.clear()
+
+            executor.shutdown(wait=False)
+            executor = _new_pool(workers)
+
+            for job in lost:
+                future = submit(job)
+                if isinstance(future.exception(), BrokenProcessPool):
+                    finish(job[0], error="Worker process crashed while analysing this file")
+                    executor.shutdown(wait=False)
+                    executor = _new_pool(workers)
+                else:
+                    finish(job[0], future)
+            lost.clear()
+
+    except KeyboardInterrupt:
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+
+    executor.shutdown()
+
+
+def _new_pool(workers: int) -> ProcessPoolExecutor:
+    # Never fork: the walk and log writer threads are already running,
+    # and forking a threaded process can deadlock. Workers start clean
+    # and get the database path from _init_worker.
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+    else:
+        context = multiprocessing.get_context("spawn")
+
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=context,
+        initializer=_init_worker,
+        initargs=(get_db_path(),),
+    )
+
+
+def backfill_file(filepath: str, writer: ScanWriter):
+    # Files scanned before content hashes and stream quality were stored
+    # get them the first time a scan passes them (a few small reads, no
+    # decode), so later moves are recognised and duplicates can be ranked
+    try:
+        writer.set_content(filepath, content_hash(filepath))
+    except OSError:
+        pass
+
+    try:
+        audio = MutagenFile(filepath)
+    except Exception:
+        audio = None
+    writer.set_quality(filepath, extract_quality(audio, filepath))
+
+
+def needs_scan(filepath: str, last_modified: int, scanned: dict[str, int]) -> bool:
     # -----------------------------------------
-    # Check last modified time
+    # Compare against the last scan's modified time
+    # `scanned` is the preloaded {filepath: last_modified} map
     # -----------------------------------------
-    last_modified = int(os.path.getmtime(filepath))
-    scanned_info = get_scanned_file(filepath)
-
     # Skip unchanged files
-    if scanned_info and scanned_info[0] == last_modified:
-        return
+    return scanned.get(filepath) != last_modified
+
+
+# ============================================================
+# ANALYZE FILE
+# Pure analysis, no database access: safe to run in a worker process.
+# ============================================================
+def analyze_file(filepath: str, fast_mode: bool, last_modified: int | None = None,
+                 moves_root: str | None = None) -> dict:
+    if last_modified is None:
+        last_modified = int(os.stat(filepath).st_mtime)
+
+    # -----------------------------------------
+    # Audio identity (hash of the audio payload, not tags/mtime)
+    # Hashing reads three small samples, so every scan tier can afford it
+    # -----------------------------------------
+    try:
+        content = content_hash(filepath)
+    except OSError:
+        content = None
 
     # -----------------------------------------
     # Load metadata
@@ -206,7 +545,7 @@ def process_file(filepath: str, report: ScanReport, fast_mode: bool):
         audio = MutagenFile(filepath, easy=True)
         tags = audio.tags if audio else None
     except Exception:
-        tags = None
+        audio = tags = None
 
     # -----------------------------------------
     # Extract metadata
@@ -216,77 +555,273 @@ def process_file(filepath: str, report: ScanReport, fast_mode: bool):
     genre = normalize_genre(extract_genre(tags))
     bpm = extract_bpm(tags)
     key = extract_key(tags)
-     
+    quality = extract_quality(audio, filepath)
+
+    # -----------------------------------------
+    # Moved / renamed file: same audio as a scanned path that no
+    # longer exists. Relinked by the parent with its current tags
+    # (often retagged in the same pass); no audio analysis.
+    # -----------------------------------------
+    if moves_root is not None and content:
+        moved_from = find_moved_file(filepath, content, moves_root)
+        if moved_from:
+            return {
+                "filepath": filepath,
+                "last_modified": last_modified,
+                "title": title,
+                "artist": artist,
+                "genre": genre,
+                "bpm": bpm,
+                "key": key,
+                "quality": quality,
+                "content": content,
+                "moved_from": moved_from,
+            }
+
+    # -----------------------------------------
+    # Analysis cache (keyed by the audio payload)
+    # -----------------------------------------
+    cached = None
+    detected_bpm = detected_key = fingerprint = None
+
+    if content:
+        cached = get_cached_analysis(*content, ANALYZER_VERSION)
+        if cached:
+            detected_bpm, detected_key, fingerprint = cached
+
+    # -----------------------------------------
+    # Fast scan: tags + cache only; queue whatever is still missing
+    # -----------------------------------------
+    if fast_mode:
+        bpm = bpm if bpm is not None else detected_bpm
+        key = key if key is not None else detected_key
+
+        return {
+            "filepath": filepath,
+            "last_modified": last_modified,
+            "title": title,
+            "artist": artist,
+            "genre": genre,
+            "bpm": bpm,
+            "key": key,
+            "fingerprint": fingerprint,
+            "quality": quality,
+            "decodes": 0,
+            "content": content,
+            "cache_hit": cached is not None,
+            "cache_update": False,
+            "detected_bpm": detected_bpm,
+            "detected_key": detected_key,
+            "queued": bpm is None or key is None or fingerprint is None,
+        }
+
     # -----------------------------------------
     # Intelligent detection (BPM, Key)
+    # One decode is shared by every analysis step
     # -----------------------------------------
+    analysis = AnalysisContext(filepath)
+
     if bpm is None:
-        detected_bpm = detect_bpm(filepath)
+        if detected_bpm is None:
+            detected_bpm = detect_bpm(analysis)
         if detected_bpm:
             bpm = detected_bpm
 
     if key is None:
-        detected_key = detect_key(filepath)
+        if detected_key is None:
+            detected_key = detect_key(analysis)
         if detected_key:
             key = detected_key
 
     # -----------------------------------------
-    # Fingerprint (skip in fast mode)
+    # Fingerprint
     # -----------------------------------------
-    fingerprint = None
-    if not fast_mode:
-        fingerprint = generate_fingerprint(filepath)
+    if fingerprint is None:
+        samples = analysis.head(FINGERPRINT_WINDOW_MS)
+        if samples is not None:
+            fingerprint = generate_fingerprint(filepath, samples=samples)
+
+    return {
+        "filepath": filepath,
+        "last_modified": last_modified,
+        "title": title,
+        "artist": artist,
+        "genre": genre,
+        "bpm": bpm,
+        "key": key,
+        "fingerprint": fingerprint,
+        "quality": quality,
+        "decodes": analysis.decodes,
+        "content": content,
+        "cache_hit": cached is not None,
+        # A hit with gaps this pass filled in (e.g. the cached copy was
+        # tagged, so its BPM / key were never detected)
+        "cache_update": cached is not None and tuple(cached) != (detected_bpm, detected_key, fingerprint),
+        "detected_bpm": detected_bpm,
+        "detected_key": detected_key,
+        "queued": False,
+    }
+
+
+def find_moved_file(filepath: str, content, root: str | None = None) -> str | None:
+    """
+    A scanned path with the same audio as `filepath` that has moved
+    away, i.e. where this file was moved from.
+    """
+    for candidate in find_scanned_by_content(*content):
+        if candidate != filepath and moved_away(candidate, root):
+            return candidate
+    return None
+
+
+def moved_away(old_filepath: str, root: str | None = None) -> bool:
+    """
+    True if `old_filepath` is gone because the file moved, not because
+    its drive is unmounted: it was inside `root` (the folder being
+    scanned), or the folder it was in still exists. The same rule as
+    prune, which never touches a folder that can't be found.
+    """
+    if os.path.exists(old_filepath):
+        return False
+
+    if root is not None and is_under(old_filepath, {os.path.normpath(root)}):
+        return True
+
+    return os.path.isdir(os.path.dirname(old_filepath))
+
+
+# ============================================================
+# STORE RESULT
+# Duplicate check + buffered database writes for one analyzed file.
+# The caller calls writer.file_done() once the file is handled.
+# ============================================================
+def store_result(result: dict, report: ScanReport, writer: ScanWriter, moves_root: str | None = None):
+    filepath = result["filepath"]
+    last_modified = result["last_modified"]
+
+    # -----------------------------------------
+    # Moved / renamed: repoint the existing rows (crates keep the track ID)
+    # -----------------------------------------
+    if "moved_from" in result:
+        if writer.relocate(result["moved_from"], filepath, last_modified):
+            writer.retag(
+                filepath, result["title"], result["artist"], result["genre"],
+                result["bpm"], result["key"], result["quality"],
+            )
+            log_moved(result["moved_from"], filepath)
+            report.inc_moved()
+        else:
+            # A second copy of a file that was moved in this scan
+            log_duplicate(filepath)
+            report.inc_duplicate()
+            writer.mark_scanned(filepath, last_modified, None, result["content"])
+            writer.mark_duplicate(filepath, writer.moved_to(result["moved_from"]))
+        return
+
+    fingerprint = result["fingerprint"]
+    bpm = result["bpm"]
+    key = result["key"]
+    genre = result["genre"]
+    queued = result["queued"]
+
+    report.inc_analyzed(result["decodes"])
+
+    # -----------------------------------------
+    # Analysis cache
+    # -----------------------------------------
+    if result["content"]:
+        hit = result["cache_hit"]
+        report.inc_cache(hit)
+
+        if not queued and (not hit or result["cache_update"]):
+            writer.cache_analysis(
+                *result["content"],
+                ANALYZER_VERSION,
+                result["detected_bpm"],
+                result["detected_key"],
+                fingerprint,
+            )
+
+    # -----------------------------------------
+    # Analysis queue: defer, or mark finished
+    # -----------------------------------------
+    if queued:
+        writer.queue_analysis(filepath)
+        report.inc_queued()
+    else:
+        writer.analysis_done(filepath)
 
     # -----------------------------------------
     # Duplicate detection
     # -----------------------------------------
-    if fingerprint and not fast_mode:
-        existing_track_id = fingerprint_exists(fingerprint)
-        if existing_track_id:
+    duplicate_of = writer.duplicate_of(fingerprint, filepath) if fingerprint else None
+    moved = False
+
+    if duplicate_of is not None:
+        # Same audio as a track whose file is gone: moved before its
+        # content hash was recorded, or re-encoded and the original
+        # deleted. Relink the track (it keeps its ID and crates); the
+        # upsert below then refreshes its tags and quality.
+        if moved_away(duplicate_of, moves_root) and writer.relocate(duplicate_of, filepath, last_modified):
+            log_moved(duplicate_of, filepath)
+            report.inc_moved()
+            moved = True
+        else:
             log_duplicate(filepath)
             report.inc_duplicate()
-            update_scanned_file(filepath, last_modified, fingerprint)
+            # Not added, but a row left by an earlier fast scan gets its analysis
+            writer.update_analysis(filepath, bpm, key)
+            writer.mark_scanned(filepath, last_modified, fingerprint, result["content"])
+            writer.mark_duplicate(filepath, duplicate_of)
             return
 
     # -----------------------------------------
-    # Insert into database
+    # Queue for the database
+    # A changed file's upsert updates its row (same track ID)
     # -----------------------------------------
-    track_id = insert_track(
-        title=title,
-        artist=artist,
+    existing = not moved and writer.has_track(filepath)
+
+    writer.add_track(
+        title=result["title"],
+        artist=result["artist"],
         genre=genre,
         bpm=bpm,
         key=key,
         filepath=filepath,
+        quality=result["quality"],
     )
 
     # Store fingerprint (only in full scan)
-    if fingerprint and not fast_mode:
-        insert_fingerprint(fingerprint, track_id)
+    if fingerprint:
+        writer.add_fingerprint(fingerprint, filepath)
 
     # Update scanned_files table
-    update_scanned_file(filepath, last_modified, fingerprint)
+    writer.mark_scanned(filepath, last_modified, fingerprint, result["content"])
+
+    if moved:
+        return
 
     # -----------------------------------------
     # Logging + report counters
     # -----------------------------------------
-    log_added(filepath)
-    report.inc_added()
-
-    if bpm is None:
+    if existing:
+        log_updated(filepath)
+        report.inc_updated()
+    else:
+        log_added(filepath)
+        report.inc_added()
+
+    # Queued files get their BPM / key later
+    if bpm is None and not queued:
         log_missing_bpm(filepath)
         report.inc_missing_bpm()
 
-    if key is None:
+    if key is None and not queued:
         log_missing_key(filepath)
         report.inc_missing_key()
 
-    if genre is None:
+    # Genre comes from tags only: reported once, when the track is added
+    # (not again when a queued file's analysis lands or it's rescanned)
+    if genre is None and not existing:
         log_missing_genre(filepath)
         report.inc_missing_genre()
-
-
-
-
-
-
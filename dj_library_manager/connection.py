@@ -0,0 +1,107 @@
+# connection.py
+#
+# Shared SQLite connection layer used by database.py and db_upgrade.py.
+# - one persistent connection per process / thread
+# - WAL journal mode + tuned pragmas
+# - explicit, nestable transaction scopes
+# - configurable database path (DJ_LIBRARY_DB env var or set_db_path)
+
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+DEFAULT_DB_PATH = "dj_library.db"
+
+_db_path = os.environ.get("DJ_LIBRARY_DB") or DEFAULT_DB_PATH
+
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",     # safe with WAL, far fewer fsyncs
+    "PRAGMA cache_size = -65536",      # 64 MB page cache
+    "PRAGMA mmap_size = 268435456",    # 256 MB memory-mapped I/O
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA busy_timeout = 5000",
+)
+
+_local = threading.local()
+
+
+# ============================================================
+# Database path
+# ============================================================
+def get_db_path() -> str:
+    return _db_path
+
+
+def set_db_path(path: str):
+    """
+    Points the connection layer at another database file.
+    The current thread's connection is closed; it reopens on next use.
+    """
+    global _db_path
+    close_connection()
+    _db_path = path
+
+
+# ============================================================
+# Connection management
+# ============================================================
+def get_connection() -> sqlite3.Connection:
+    """
+    Returns this thread's connection, opening it on first use.
+    Connections are never shared across processes: a forked worker
+    gets a fresh one.
+    """
+    conn = getattr(_local, "conn", None)
+
+    if conn is not None and _local.pid == os.getpid() and _local.path == _db_path:
+        return conn
+
+    # isolation_level=None: no implicit transactions, scopes are explicit
+    conn = sqlite3.connect(_db_path, isolation_level=None)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+
+    _local.conn = conn
+    _local.pid = os.getpid()
+    _local.path = _db_path
+    _local.depth = 0
+    return conn
+
+
+def close_connection():
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.pid == os.getpid():
+        conn.close()
+    _local.conn = None
+
+
+# ============================================================
+# Transaction scopes
+# ============================================================
+@contextmanager
+def transaction():
+    """
+    Runs the enclosed block in a single transaction.
+    Nested scopes join the outermost one, which commits on success
+    and rolls back if an exception escapes.
+    """
+    conn = get_connection()
+    outermost = _local.depth == 0
+
+    if outermost:
+        conn.execute("BEGIN")
+    _local.depth += 1
+
+    try:
+        yield conn
+    except BaseException:
+        _local.depth -= 1
+        if outermost:
+            conn.execute("ROLLBACK")
+        raise
+
+    _local.depth -= 1
+    if outermost:
+        conn.execute("COMMIT")
@@ -0,0 +1,152 @@
+# content_hash.py
+#
+# Fast hash of a file's audio payload, ignoring tag data.
+# Tag edits rewrite ID3 frames / FLAC metadata blocks / RIFF chunks /
+# MP4 atoms but leave the audio bytes alone, so the hash (and the
+# analysis cached under it) survives retagging, copying and `touch`.
+#
+# Only three fixed-size samples of the payload are read, so hashing
+# costs a few small reads regardless of file size.
+
+import hashlib
+import os
+import struct
+
+SAMPLE_SIZE = 64 * 1024
+
+
+# ============================================================
+# Locate the audio payload
+# ============================================================
+def _id3_payload(f, size: int) -> tuple[int, int]:
+    # MP3 / ADTS AAC: skip a leading ID3v2 tag and a trailing ID3v1 tag
+    start, end = 0, size
+
+    header = f.read(10)
+    if len(header) == 10 and header[:3] == b"ID3":
+        tag_size = 0
+        for b in header[6:10]:
+            tag_size = (tag_size << 7) | (b & 0x7F)
+        start = 10 + tag_size + (10 if header[5] & 0x10 else 0)
+
+    if end - start >= 128:
+        f.seek(end - 128)
+        if f.read(3) == b"TAG":
+            end -= 128
+
+    return start, end
+
+
+def _flac_payload(f, size: int) -> tuple[int, int]:
+    # FLAC: audio frames start after the last metadata block
+    if f.read(4) != b"fLaC":
+        return 0, size
+
+    pos = 4
+    while pos + 4 <= size:
+        f.seek(pos)
+        block_header = f.read(4)
+        is_last = block_header[0] & 0x80
+        length = int.from_bytes(block_header[1:4], "big")
+        pos += 4 + length
+        if is_last:
+            break
+
+    return min(pos, size), size
+
+
+def _riff_payload(f, size: int) -> tuple[int, int]:
+    # WAV: just the "data" chunk
+    if f.read(12)[8:12] != b"WAVE":
+        return 0, size
+
+    pos = 12
+    while pos + 8 <= size:
+        f.seek(pos)
+        chunk_id, chunk_size = struct.unpack("<4sI", f.read(8))
+        if chunk_id == b"data":
+            return pos + 8, min(pos + 8 + chunk_size, size)
+        pos += 8 + chunk_size + (chunk_size & 1)
+
+    return 0, size
+
+
+def _mp4_payload(f, size: int) -> tuple[int, int]:
+    # M4A: just the top-level "mdat" atom (tags live in moov/udta)
+    pos = 0
+    while pos + 8 <= size:
+        f.seek(pos)
+        atom_size, atom_type = struct.unpack(">I4s", f.read(8))
+        header = 8
+
+        if atom_size == 1:
+            atom_size = struct.unpack(">Q", f.read(8))[0]
+            header = 16
+        elif atom_size == 0:
+            atom_size = size - pos
+
+        if atom_type == b"mdat":
+            return pos + header, min(pos + atom_size, size)
+        if atom_size < header:
+            break
+        pos += atom_size
+
+    return 0, size
+
+
+_PAYLOAD_READERS = {
+    ".mp3": _id3_payload,
+    ".aac": _id3_payload,
+    ".flac": _flac_payload,
+    ".wav": _riff_payload,
+    ".m4a": _mp4_payload,
+}
+
+
+def audio_payload_range(filepath: str) -> tuple[int, int]:
+    """
+    Returns (start, end) byte offsets of the audio payload.
+    Falls back to the whole file for unknown or malformed containers.
+    """
+    size = os.path.getsize(filepath)
+    reader = _PAYLOAD_READERS.get(os.path.splitext(filepath)[1].lower())
+
+    if reader is None:
+        return 0, size
+
+    with open(filepath, "rb") as f:
+        try:
+            start, end = reader(f, size)
+        except (struct.error, IndexError, OSError):
+            return 0, size
+
+    if not 0 <= start < end <= size:
+        return 0, size
+    return start, end
+
+
+# ============================================================
+# Hash
+# ============================================================
+def content_hash(filepath: str) -> tuple[str, int]:
+    """
+    Returns (hash, audio_size): a hex digest of the head, middle and
+    tail of the audio payload, and the payload's size in bytes.
+    """
+    start, end = audio_payload_range(filepath)
+    audio_size = end - start
+
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(audio_size.to_bytes(8, "little"))
+
+    with open(filepath, "rb") as f:
+        if audio_size <= 3 * SAMPLE_SIZE:
+            f.seek(start)
+            digest.update(f.read(audio_size))
+        else:
+            middle = start + (audio_size - SAMPLE_SIZE) // 2
+            for offset in (start, middle, end - SAMPLE_SIZE):
+                f.seek(offset)
+                digest.update(f.read(SAMPLE_SIZE))
+
+    return digest.hexdigest(), audio_size
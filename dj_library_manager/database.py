@@ -1,140 +1,263 @@
 
-import sqlite3
+import json
+import re
+
+from dj_library_manager.connection import get_connection, transaction
+from dj_library_manager.db_upgrade import upgrade_database, path_range, SQL_NOW
+from dj_library_manager.metadata_utils import normalize_key, harmonic_neighbors, LOSSLESS_CODECS
+
+# Column order of the track rows returned by the readers below
+# (what format_track unpacks); later columns are internal bookkeeping
+TRACK_COLUMNS = "id, title, artist, bpm, musical_key, genre, filepath"
 
 
 # =========================================================
 # Database Initialization
+# The schema itself lives in db_upgrade's versioned migrations
 # =========================================================
 def init_db():
-    conn = sqlite3.connect("dj_library.db")
-    cursor = conn.cursor()
-
-    # Tracks table
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS tracks (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT,
-            artist TEXT,
-            bpm INTEGER,
-            musical_key TEXT,
-            genre TEXT,
-            filepath TEXT
-        )
-    """)
-
-    # Crates table
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS crates (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT
-        )
-    """)
-
-    # Crate-to-track mapping
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS crate_tracks (
-            crate_id INTEGER,
-            track_id INTEGER,
-            FOREIGN KEY (crate_id) REFERENCES crates(id),
-            FOREIGN KEY (track_id) REFERENCES tracks(id)
-        )
-    """)
-
-    conn.commit()
-    conn.close()
+    upgrade_database()
 
 
 # =========================================================
-# Insert Track (used by audio_reader.py)
+# Insert / Update Track
+# A rescanned file updates its existing row, keeping the track ID
+# (and therefore its crate memberships). Rows whose metadata didn't
+# change are left alone, so updated_at only moves on real edits.
 # =========================================================
-def insert_track(title, artist, genre, bpm, key, filepath):
-    conn = sqlite3.connect("dj_library.db")
-    cursor = conn.cursor()
-
-    cursor.execute("""
-        INSERT INTO tracks (title, artist, bpm, musical_key, genre, filepath)
-        VALUES (?, ?, ?, ?, ?, ?)
-    """, (title, artist, bpm, key, genre, filepath))
-
-    track_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
-
-    return track_id
+TRACK_UPSERT = f"""
+    INSERT INTO tracks (
+        title, artist, bpm, musical_key, camelot_key, genre,
+        codec, bitrate, sample_rate, duration, filepath, updated_at
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, {SQL_NOW})
+    ON CONFLICT(filepath) DO UPDATE SET
+        title = excluded.title,
+        artist = excluded.artist,
+        bpm = excluded.bpm,
+        musical_key = excluded.musical_key,
+        camelot_key = excluded.camelot_key,
+        genre = excluded.genre,
+        codec = excluded.codec,
+        bitrate = excluded.bitrate,
+        sample_rate = excluded.sample_rate,
+        duration = excluded.duration,
+        updated_at = excluded.updated_at
+    WHERE title IS NOT excluded.title
+       OR artist IS NOT excluded.artist
+       OR bpm IS NOT excluded.bpm
+       OR musical_key IS NOT excluded.musical_key
+       OR camelot_key IS NOT excluded.camelot_key
+       OR genre IS NOT excluded.genre
+       OR codec IS NOT excluded.codec
+       OR bitrate IS NOT excluded.bitrate
+       OR sample_rate IS NOT excluded.sample_rate
+       OR duration IS NOT excluded.duration
+"""
+
+
+# Fills in analysis for a track that's already stored (e.g. a fast-scan
+# import later found to be a duplicate); never inserts a row
+TRACK_ANALYSIS_UPDATE = f"""
+    UPDATE tracks
+    SET bpm = ?, musical_key = ?, camelot_key = ?, updated_at = {SQL_NOW}
+    WHERE filepath = ?
+      AND (bpm IS NOT ?1 OR musical_key IS NOT ?2)
+"""
+
+
+# Tags of a moved / renamed file, stored without analysing it again:
+# tag BPM / key only replace the stored (possibly detected) ones when set
+TRACK_TAGS_UPDATE = f"""
+    UPDATE tracks
+    SET title = ?1, artist = ?2, genre = ?3,
+        bpm = COALESCE(?4, bpm),
+        musical_key = COALESCE(?5, musical_key),
+        camelot_key = COALESCE(?6, camelot_key),
+        codec = ?7, bitrate = ?8, sample_rate = ?9, duration = ?10,
+        updated_at = {SQL_NOW}
+    WHERE filepath = ?11
+      AND (title IS NOT ?1 OR artist IS NOT ?2 OR genre IS NOT ?3
+           OR bpm IS NOT COALESCE(?4, bpm)
+           OR musical_key IS NOT COALESCE(?5, musical_key)
+           OR codec IS NOT ?7 OR bitrate IS NOT ?8
+           OR sample_rate IS NOT ?9 OR duration IS NOT ?10)
+"""
 
 
 # =========================================================
 # Auto‑Crate Creation
+# A crate stores its filter as JSON. Populating it is one
+# INSERT ... SELECT plus one DELETE; a refresh only looks at tracks
+# whose metadata changed since the crate was last refreshed.
 # =========================================================
-def auto_crate(name, min_bpm=None, max_bpm=None, key=None, genre=None, artist=None, title=None):
-    conn = sqlite3.connect("dj_library.db")
-    cursor = conn.cursor()
+CRATE_FILTERS = ("min_bpm", "max_bpm", "key", "genre", "artist", "title")
 
-    # Create crate
-    cursor.execute("INSERT INTO crates (name) VALUES (?)", (name,))
-    crate_id = cursor.lastrowid
 
-    # Build dynamic query
-    query = "SELECT id FROM tracks WHERE 1=1"
+def build_crate_filter(filters):
+    """
+    Returns (sql, params): a WHERE expression over tracks for a filter dict.
+    """
+    clauses = ["1=1"]
     params = []
 
-    if min_bpm is not None:
-        query += " AND bpm >= ?"
-        params.append(min_bpm)
+    if filters.get("min_bpm") is not None:
+        clauses.append("bpm >= ?")
+        params.append(filters["min_bpm"])
 
-    if max_bpm is not None:
-        query += " AND bpm <= ?"
-        params.append(max_bpm)
+    if filters.get("max_bpm") is not None:
+        clauses.append("bpm <= ?")
+        params.append(filters["max_bpm"])
 
-    if key is not None:
-        query += " AND musical_key = ?"
-        params.append(key)
+    if filters.get("key") is not None:
+        # One key or a list of keys, in any notation
+        keys = filters["key"] if isinstance(filters["key"], list) else [filters["key"]]
+        camelot = sorted({normalize_key(k) for k in keys} - {None})
+        clauses.append(f"camelot_key IN ({', '.join('?' * len(camelot)) or 'NULL'})")
+        params.extend(camelot)
 
-    if genre is not None:
-        query += " AND genre = ?"
-        params.append(genre)
+    if filters.get("genre") is not None:
+        clauses.append("genre = ?")
+        params.append(filters["genre"])
 
-    if artist is not None:
-        query += " AND artist LIKE ?"
-        params.append(f"%{artist}%")
+    if filters.get("artist") is not None:
+        clauses.append("artist LIKE ?")
+        params.append(f"%{filters['artist']}%")
 
-    if title is not None:
-        query += " AND title LIKE ?"
-        params.append(f"%{title}%")
+    if filters.get("title") is not None:
+        clauses.append("title LIKE ?")
+        params.append(f"%{filters['title']}%")
 
-    cursor.execute(query, params)
-    tracks = cursor.fetchall()
+    return " AND ".join(clauses), params
 
-    # Add tracks to crate
-    for (track_id,) in tracks:
-        cursor.execute(
-            "INSERT INTO crate_tracks (crate_id, track_id) VALUES (?, ?)",
-            (crate_id, track_id)
-        )
 
-    conn.commit()
-    conn.close()
-
-    print(f"Auto‑crate '{name}' created with {len(tracks)} tracks.")
+def auto_crate(name, min_bpm=None, max_bpm=None, key=None, genre=None, artist=None, title=None):
+    """
+    Creates the crate, or refreshes it if a crate with this name exists.
+    Changing a crate's filter rebuilds it from scratch.
+    """
+    values = dict(min_bpm=min_bpm, max_bpm=max_bpm, key=key, genre=genre, artist=artist, title=title)
+    filters = json.dumps({k: v for k, v in values.items() if v is not None}, sort_keys=True)
+
+    with transaction() as conn:
+        cursor = conn.cursor()
+
+        cursor.execute("SELECT id, filters FROM crates WHERE name = ? ORDER BY id LIMIT 1", (name,))
+        row = cursor.fetchone()
+
+        if row is None:
+            cursor.execute("INSERT INTO crates (name, filters) VALUES (?, ?)", (name, filters))
+            crate_id, full = cursor.lastrowid, True
+            action = "created"
+        else:
+            crate_id, full = row[0], row[1] != filters
+            if full:
+                cursor.execute("UPDATE crates SET filters = ? WHERE id = ?", (filters, crate_id))
+            action = "refreshed"
+
+        count = refresh_crate(crate_id, full=full)
+
+    print(f"Auto‑crate '{name}' {action} with {count} tracks.")
+    return crate_id
+
+
+def refresh_crate(crate_id, full=False):
+    """
+    Brings a smart crate's tracks in line with its filter.
+    Incremental by default: only tracks updated since the last refresh
+    are added or removed. Returns the crate's track count.
+    """
+    with transaction() as conn:
+        cursor = conn.cursor()
+
+        cursor.execute(f"SELECT filters, refreshed_at, {SQL_NOW} FROM crates WHERE id = ?", (crate_id,))
+        filters, refreshed_at, now = cursor.fetchone()
+
+        if filters is not None:
+            where, params = build_crate_filter(json.loads(filters))
+
+            if full or refreshed_at is None:
+                changed, since = "1=1", []
+
+                # Drop everything that no longer matches (or no longer exists)...
+                cursor.execute(f"""
+                    DELETE FROM crate_tracks
+                    WHERE crate_id = ?
+                      AND track_id NOT IN (SELECT id FROM tracks WHERE {where})
+                """, [crate_id, *params])
+            else:
+                changed, since = "updated_at >= ?", [refreshed_at]
+
+                # Drop changed tracks that no longer match...
+                cursor.execute(f"""
+                    DELETE FROM crate_tracks
+                    WHERE crate_id = ?
+                      AND track_id IN (
+                          SELECT id FROM tracks WHERE {changed}
+                          EXCEPT
+                          SELECT id FROM tracks WHERE {changed} AND {where}
+                      )
+                """, [crate_id, *since, *since, *params])
+
+            # ...and add (changed) tracks that now do
+            cursor.execute(f"""
+                INSERT OR IGNORE INTO crate_tracks (crate_id, track_id)
+                SELECT ?, id FROM tracks
+                WHERE {changed} AND {where}
+            """, [crate_id, *since, *params])
+
+            cursor.execute("UPDATE crates SET refreshed_at = ? WHERE id = ?", (now, crate_id))
+
+        cursor.execute("SELECT COUNT(*) FROM crate_tracks WHERE crate_id = ?", (crate_id,))
+        return cursor.fetchone()[0]
+
+
+def refresh_all_crates(full=False):
+    """
+    Refreshes every smart crate, e.g. after a scan.
+    Returns {crate name: track count}.
+    """
+    counts = {}
+
+    with transaction() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, name FROM crates WHERE filters IS NOT NULL ORDER BY id")
+
+        for crate_id, name in cursor.fetchall():
+            counts[name] = refresh_crate(crate_id, full=full)
+
+    return counts
 
 
 # =========================================================
 # Track Retrieval
 # =========================================================
 def get_tracks():
-    conn = sqlite3.connect("dj_library.db")
-    cursor = conn.cursor()
+    cursor = get_connection().cursor()
 
-    cursor.execute("SELECT * FROM tracks ORDER BY artist, title")
+    cursor.execute(f"SELECT {TRACK_COLUMNS} FROM tracks ORDER BY artist, title")
     results = cursor.fetchall()
 
-    conn.close()
     return results
 
 
+def track_exists(filepath):
+    cursor = get_connection().cursor()
+
+    cursor.execute("SELECT 1 FROM tracks WHERE filepath = ?", (filepath,))
+    return cursor.fetchone() is not None
+
+
+def get_track_filepath(track_id):
+    cursor = get_connection().cursor()
+
+    cursor.execute("SELECT filepath FROM tracks WHERE id = ?", (track_id,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
 def get_tracks_in_crate(crate_id):
-    conn = sqlite3.connect("dj_library.db")
-    cursor = conn.cursor()
+    cursor = get_connection().cursor()
 
     cursor.execute("""
         SELECT tracks.id, tracks.title, tracks.artist, tracks.bpm,
@@ -146,7 +269,6 @@ def get_tracks_in_crate(crate_id):
     """, (crate_id,))
 
     results = cursor.fetchall()
-    conn.close()
     return results
 
 
@@ -154,47 +276,219 @@ def get_tracks_in_crate(crate_id):
 # Crate Retrieval
 # =========================================================
 def get_crates():
-    conn = sqlite3.connect("dj_library.db")
-    cursor = conn.cursor()
+    cursor = get_connection().cursor()
 
     cursor.execute("SELECT id, name FROM crates")
     crates = cursor.fetchall()
 
-    conn.close()
     return crates
 
 
 # =========================================================
-# Searching
+# Harmonic Mixing
+# Keys are compared through the indexed camelot_key column
 # =========================================================
-def search_by_artist(term):
-    conn = sqlite3.connect("dj_library.db")
-    cursor = conn.cursor()
+def count_tracks_by_key():
+    """
+    Returns {camelot code: track count} for tracks with a known key.
+    """
+    cursor = get_connection().cursor()
 
     cursor.execute("""
-        SELECT * FROM tracks
-        WHERE artist LIKE ?
+        SELECT camelot_key, COUNT(*)
+        FROM tracks
+        WHERE camelot_key IS NOT NULL
+        GROUP BY camelot_key
+    """)
+
+    return dict(cursor.fetchall())
+
+
+def find_harmonic_matches(track_id, limit=50):
+    """
+    Tracks in a key compatible with the given track's (same key, ±1 on
+    the Camelot wheel, relative major/minor), same key and closest BPM first.
+    """
+    cursor = get_connection().cursor()
+
+    cursor.execute("SELECT camelot_key, bpm FROM tracks WHERE id = ?", (track_id,))
+    row = cursor.fetchone()
+    if row is None or row[0] is None:
+        return []
+
+    camelot, bpm = row
+    keys = harmonic_neighbors(camelot)
+
+    cursor.execute(f"""
+        SELECT {TRACK_COLUMNS} FROM tracks
+        WHERE camelot_key IN ({", ".join("?" * len(keys))})
+          AND id != ?
+        ORDER BY camelot_key != ?, ABS(COALESCE(bpm, 0) - ?), artist, title
+        LIMIT ?
+    """, (*keys, track_id, camelot, bpm or 0, limit))
+
+    return cursor.fetchall()
+
+
+# =========================================================
+# Searching
+# FTS5 full-text search (see db_upgrade's tracks_fts migration):
+# ranked, prefix-matching, diacritic-insensitive, multi-word.
+# Falls back to LIKE when the SQLite build has no FTS5.
+# =========================================================
+SEARCH_LIMIT = 100
+
+# bm25 column weights: title, artist, genre
+SEARCH_WEIGHTS = (10.0, 10.0, 1.0)
+
+
+def fts_available():
+    cursor = get_connection().cursor()
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'tracks_fts'")
+    return cursor.fetchone() is not None
+
+
+def build_fts_query(term, column=None):
+    """
+    Turns free text into an FTS5 query: every word must match,
+    each as a prefix ("dav gue" finds "David Guetta").
+    """
+    words = re.findall(r"\w+", term)
+    prefix = f"{column} : " if column else ""
+    return " AND ".join(f'{prefix}"{word}"*' for word in words)
+
+
+def search_tracks(term, column=None, limit=SEARCH_LIMIT):
+    """
+    Single ranked search over title, artist and genre
+    (or just `column` if given). Returns full track rows, best first.
+    """
+    if not fts_available():
+        return _search_like(term, column, limit)
+
+    query = build_fts_query(term, column)
+    if not query:
+        return []
+
+    cursor = get_connection().cursor()
+    cursor.execute(f"""
+        SELECT {", ".join("tracks." + c for c in TRACK_COLUMNS.split(", "))}
+        FROM tracks_fts
+        JOIN tracks ON tracks.id = tracks_fts.rowid
+        WHERE tracks_fts MATCH ?
+        ORDER BY bm25(tracks_fts, ?, ?, ?), tracks.artist, tracks.title
+        LIMIT ?
+    """, (query, *SEARCH_WEIGHTS, limit))
+
+    return cursor.fetchall()
+
+
+def _search_like(term, column, limit):
+    columns = [column] if column else ["title", "artist", "genre"]
+    where = " OR ".join(f"{c} LIKE ?" for c in columns)
+
+    cursor = get_connection().cursor()
+    cursor.execute(f"""
+        SELECT {TRACK_COLUMNS} FROM tracks
+        WHERE {where}
         ORDER BY artist, title
-    """, (f"%{term}%",))
+        LIMIT ?
+    """, (*[f"%{term}%"] * len(columns), limit))
 
-    results = cursor.fetchall()
-    conn.close()
-    return results
+    return cursor.fetchall()
+
+
+def search_by_artist(term):
+    return search_tracks(term, column="artist")
 
 
 def search_by_title(term):
-    conn = sqlite3.connect("dj_library.db")
-    cursor = conn.cursor()
+    return search_tracks(term, column="title")
+
 
+# =========================================================
+# Missing Files
+# Every row belonging to files that are gone, removed in one
+# transaction via a temp table of paths
+# =========================================================
+def load_library_paths(root):
+    """
+    All paths under `root` known to the library (tracks or scanned_files).
+    Range queries on the indexed filepath columns, no LIKE scan.
+    """
+    prefix, upper = path_range(root)
+
+    cursor = get_connection().cursor()
     cursor.execute("""
-        SELECT * FROM tracks
-        WHERE title LIKE ?
-        ORDER BY artist, title
-    """, (f"%{term}%",))
+        SELECT filepath FROM tracks WHERE filepath >= ? AND filepath < ?
+        UNION
+        SELECT filepath FROM scanned_files WHERE filepath >= ? AND filepath < ?
+    """, (prefix, upper, prefix, upper))
+
+    return {filepath for (filepath,) in cursor.fetchall()}
+
+
+def delete_files(filepaths):
+    """
+    Removes the files' tracks (with their crate entries, fingerprints
+    and index rows), scanned_files rows and queue entries.
+    Returns the number of tracks removed.
+    """
+    with transaction() as conn:
+        cursor = conn.cursor()
+
+        cursor.execute("CREATE TEMP TABLE IF NOT EXISTS prune_paths (filepath TEXT PRIMARY KEY)")
+        cursor.execute("DELETE FROM prune_paths")
+        cursor.executemany(
+            "INSERT OR IGNORE INTO prune_paths (filepath) VALUES (?)",
+            [(filepath,) for filepath in filepaths]
+        )
 
-    results = cursor.fetchall()
-    conn.close()
-    return results
+        _clear_removed_tracks(cursor)
+        cursor.execute("""
+            INSERT INTO removed_tracks (id)
+            SELECT tracks.id FROM prune_paths
+            JOIN tracks ON tracks.filepath = prune_paths.filepath
+        """)
+
+        # Copies skipped as duplicates of a removed track are forgotten,
+        # so the next scan adds one of them in its place. Rows from
+        # before duplicate_of was recorded match by fingerprint.
+        cursor.execute("""
+            DELETE FROM scanned_files
+            WHERE duplicate_of IN (SELECT filepath FROM prune_paths)
+               OR (
+                    duplicate_of IS NULL
+                    AND fingerprint IN (
+                        SELECT fingerprint FROM fingerprints
+                        WHERE track_id IN (SELECT id FROM removed_tracks)
+                    )
+                    AND NOT EXISTS (
+                        SELECT 1 FROM tracks WHERE tracks.filepath = scanned_files.filepath
+                    )
+               )
+        """)
+
+        removed = _delete_removed_tracks(cursor)
+
+        cursor.execute("DELETE FROM scanned_files WHERE filepath IN (SELECT filepath FROM prune_paths)")
+        cursor.execute("DELETE FROM analysis_queue WHERE filepath IN (SELECT filepath FROM prune_paths)")
+
+    return removed
+
+
+def _clear_removed_tracks(cursor):
+    cursor.execute("CREATE TEMP TABLE IF NOT EXISTS removed_tracks (id INTEGER PRIMARY KEY)")
+    cursor.execute("DELETE FROM removed_tracks")
+
+
+def _delete_removed_tracks(cursor):
+    # Every row keyed by the track IDs in the removed_tracks temp table
+    cursor.execute("DELETE FROM crate_tracks WHERE track_id IN (SELECT id FROM removed_tracks)")
+    cursor.execute("DELETE FROM fingerprint_index WHERE track_id IN (SELECT id FROM removed_tracks)")
+    cursor.execute("DELETE FROM fingerprints WHERE track_id IN (SELECT id FROM removed_tracks)")
+    cursor.execute("DELETE FROM tracks WHERE id IN (SELECT id FROM removed_tracks)")
+    return cursor.rowcount
 
 
 # =========================================================
@@ -209,8 +503,7 @@ def format_track(track):
 # Missing Metadata Reports
 # =========================================================
 def show_tracks_missing_bpm():
-    conn = sqlite3.connect("dj_library.db")
-    cursor = conn.cursor()
+    cursor = get_connection().cursor()
 
     cursor.execute("""
         SELECT title, artist, filepath, bpm
@@ -222,7 +515,6 @@ def show_tracks_missing_bpm():
     """)
 
     results = cursor.fetchall()
-    conn.close()
 
     if not results:
         print("\nAll tracks have BPM values.\n")
@@ -239,8 +531,7 @@ def show_tracks_missing_bpm():
 
 
 def show_tracks_missing_genre():
-    conn = sqlite3.connect("dj_library.db")
-    cursor = conn.cursor()
+    cursor = get_connection().cursor()
 
     cursor.execute("""
         SELECT title, artist, filepath, genre
@@ -251,7 +542,6 @@ def show_tracks_missing_genre():
     """)
 
     results = cursor.fetchall()
-    conn.close()
 
     if not results:
         print("\nAll tracks have Genre values.\n")
@@ -271,8 +561,7 @@ def show_tracks_missing_genre():
 # Duplicate Detection + Cleanup
 # =========================================================
 def find_duplicates():
-    conn = sqlite3.connect("dj_library.db")
-    cursor = conn.cursor()
+    cursor = get_connection().cursor()
 
     cursor.execute("""
         SELECT 
@@ -285,39 +574,114 @@ def find_duplicates():
     """)
 
     duplicates = cursor.fetchall()
-    conn.close()
     return duplicates
 
 
-def delete_duplicate_tracks():
-    conn = sqlite3.connect("dj_library.db")
-    cursor = conn.cursor()
-
-    cursor.execute("""
-        SELECT 
-            title, artist, bpm,
-            GROUP_CONCAT(id) AS ids
-        FROM tracks
-        GROUP BY title, artist, bpm
-        HAVING COUNT(*) > 1
+# =========================================================
+# Duplicate Cleanup
+# Copies of a (title, artist, bpm) group are ranked in one window
+# query: lossless first, then the better stream (sample rate for
+# lossless, bitrate for lossy), then the longer file, then the oldest
+# row. The top copy is kept; its crates inherit the others' entries.
+# =========================================================
+LOSSLESS_SQL = ", ".join(f"'{codec}'" for codec in LOSSLESS_CODECS)
+
+DUPLICATE_RANKING = f"""
+    SELECT
+        id, filepath, codec, bitrate, sample_rate, duration,
+        title, artist, bpm,
+        FIRST_VALUE(id) OVER copies AS keep_id,
+        ROW_NUMBER() OVER copies AS copy_rank,
+        COUNT(*) OVER (PARTITION BY title, artist, bpm) AS copy_count
+    FROM tracks
+    WINDOW copies AS (
+        PARTITION BY title, artist, bpm
+        ORDER BY
+            codec IN ({LOSSLESS_SQL}) DESC,
+            CASE WHEN codec IN ({LOSSLESS_SQL}) THEN sample_rate ELSE bitrate END DESC,
+            bitrate DESC,
+            duration DESC,
+            id
+    )
+"""
+
+
+def plan_duplicate_cleanup():
+    """
+    Dry run: which copy of each duplicate group would be kept.
+    Returns a list of {"title", "artist", "bpm", "keep", "remove"},
+    where keep/remove hold (id, filepath, codec, bitrate, sample_rate, duration).
+    """
+    cursor = get_connection().cursor()
+
+    cursor.execute(f"""
+        SELECT * FROM ({DUPLICATE_RANKING})
+        WHERE copy_count > 1
+        ORDER BY keep_id, copy_rank
     """)
 
-    groups = cursor.fetchall()
-    deleted_count = 0
+    plan = []
+    for row in cursor.fetchall():
+        copy, (title, artist, bpm, _, copy_rank, _) = row[:6], row[6:]
 
-    for title, artist, bpm, ids_str in groups:
-        ids = sorted(int(x) for x in ids_str.split(","))
+        if copy_rank == 1:
+            plan.append({"title": title, "artist": artist, "bpm": bpm, "keep": copy, "remove": []})
+        else:
+            plan[-1]["remove"].append(copy)
 
-        keep_id = ids[0]
-        delete_ids = ids[1:]
+    return plan
 
-        for track_id in delete_ids:
-            cursor.execute("DELETE FROM crate_tracks WHERE track_id = ?", (track_id,))
-            cursor.execute("DELETE FROM tracks WHERE id = ?", (track_id,))
-            deleted_count += 1
 
-    conn.commit()
-    conn.close()
-
-    return deleted_count
+def delete_duplicate_tracks():
+    """
+    Removes every copy but the best-ranked one of each duplicate group,
+    in one transaction. Returns the number of tracks removed.
+    """
+    with transaction() as conn:
+        cursor = conn.cursor()
+
+        cursor.execute("CREATE TEMP TABLE IF NOT EXISTS duplicate_copies (id INTEGER PRIMARY KEY, keep_id INTEGER)")
+        cursor.execute("DELETE FROM duplicate_copies")
+        cursor.execute(f"""
+            INSERT INTO duplicate_copies (id, keep_id)
+            SELECT id, keep_id FROM ({DUPLICATE_RANKING})
+            WHERE copy_rank > 1
+        """)
+
+        # The kept copy takes over the removed copies' crate entries
+        cursor.execute("""
+            INSERT OR IGNORE INTO crate_tracks (crate_id, track_id)
+            SELECT crate_tracks.crate_id, duplicate_copies.keep_id
+            FROM crate_tracks
+            JOIN duplicate_copies ON duplicate_copies.id = crate_tracks.track_id
+        """)
+
+        # Removed files stay in scanned_files, so unchanged copies aren't
+        # re-added by the next scan, marked as copies of the kept file
+        # (if that one is deleted later, they come back); queued
+        # analysis for them is dropped
+        cursor.execute("""
+            UPDATE scanned_files SET duplicate_of = (
+                SELECT keep.filepath FROM duplicate_copies
+                JOIN tracks AS copy ON copy.id = duplicate_copies.id
+                JOIN tracks AS keep ON keep.id = duplicate_copies.keep_id
+                WHERE copy.filepath = scanned_files.filepath
+            )
+            WHERE filepath IN (
+                SELECT tracks.filepath FROM duplicate_copies
+                JOIN tracks ON tracks.id = duplicate_copies.id
+            )
+        """)
+        cursor.execute("""
+            DELETE FROM analysis_queue WHERE filepath IN (
+                SELECT tracks.filepath FROM duplicate_copies
+                JOIN tracks ON tracks.id = duplicate_copies.id
+            )
+        """)
+
+        _clear_removed_tracks(cursor)
+        cursor.execute("INSERT INTO removed_tracks (id) SELECT id FROM duplicate_copies")
+        removed = _delete_removed_tracks(cursor)
+
+    return removed
 
@@ -1,15 +1,58 @@
-
+import os
 import sqlite3
 
-DB_PATH = "dj_library.db"
+from dj_library_manager.connection import get_connection, transaction
+from dj_library_manager.metadata_utils import normalize_key
+
+# Candidate tracks verified by Hamming distance per lookup
+MAX_FINGERPRINT_CANDIDATES = 5
+
+# Queued files that failed this many times are left for the user to inspect
+MAX_QUEUE_ATTEMPTS = 3
+
+# Current time as fractional Unix seconds, usable in any SQLite version
+SQL_NOW = "((julianday('now') - 2440587.5) * 86400.0)"
 
 
 # ============================================================
-# Database Upgrade: Adds new tables for scanning + fingerprints
+# Schema migrations
+#
+# Each step runs once, in its own transaction, and bumps
+# PRAGMA user_version. Steps stay idempotent (IF NOT EXISTS) so
+# databases created before versioning (user_version 0, tables
+# already present) upgrade cleanly. Append new steps; never reorder.
 # ============================================================
-def upgrade_database():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+def _migration_base_schema(cursor):
+    # -----------------------------------------
+    # Tables: tracks, crates, crate_tracks
+    # -----------------------------------------
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS tracks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT,
+            artist TEXT,
+            bpm INTEGER,
+            musical_key TEXT,
+            genre TEXT,
+            filepath TEXT
+        )
+    """)
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS crates (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT
+        )
+    """)
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS crate_tracks (
+            crate_id INTEGER,
+            track_id INTEGER,
+            FOREIGN KEY (crate_id) REFERENCES crates(id),
+            FOREIGN KEY (track_id) REFERENCES tracks(id)
+        )
+    """)
 
     # -----------------------------------------
     # Table: scanned_files
@@ -35,52 +78,533 @@ def upgrade_database():
         )
     """)
 
-    conn.commit()
-    conn.close()
+
+def _migration_fingerprint_index(cursor):
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_fingerprints_track
+        ON fingerprints (track_id)
+    """)
+
+    # -----------------------------------------
+    # Table: fingerprint_index
+    # Inverted index: sub-fingerprint -> tracks containing it.
+    # Finds near-duplicate candidates without scanning every fingerprint
+    # -----------------------------------------
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS fingerprint_index (
+            hash INTEGER,
+            track_id INTEGER,
+            PRIMARY KEY (hash, track_id)
+        ) WITHOUT ROWID
+    """)
+
+
+def _migration_analysis_cache(cursor):
+    # -----------------------------------------
+    # Table: analysis_cache
+    # Detected BPM / key / fingerprint keyed by a hash of the audio
+    # payload, so retagged or touched files aren't re-analyzed
+    # -----------------------------------------
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS analysis_cache (
+            content_hash TEXT,
+            audio_size INTEGER,
+            analyzer_version INTEGER,
+            bpm INTEGER,
+            musical_key TEXT,
+            fingerprint TEXT,
+            PRIMARY KEY (content_hash, audio_size)
+        )
+    """)
+
+
+def _migration_unique_filepath(cursor):
+    # -----------------------------------------
+    # Unique tracks.filepath
+    # Rescans update a track in place instead of adding a row
+    # -----------------------------------------
+    merge_duplicate_filepaths(cursor)
+    cursor.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_tracks_filepath
+        ON tracks (filepath)
+    """)
+
+
+def _migration_secondary_indexes(cursor):
+    # -----------------------------------------
+    # Indexes for browsing, searching, auto-crate filters and crate joins
+    # -----------------------------------------
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tracks_artist_title ON tracks (artist, title)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tracks_bpm ON tracks (bpm)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tracks_key ON tracks (musical_key)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tracks_genre ON tracks (genre)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_crate_tracks_crate ON crate_tracks (crate_id, track_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_crate_tracks_track ON crate_tracks (track_id)")
+
+    # Give the query planner statistics for the new indexes
+    cursor.execute("ANALYZE")
+
+
+def _migration_fulltext_search(cursor):
+    # -----------------------------------------
+    # FTS5 index over title / artist / genre, kept in sync by triggers.
+    # unicode61 + remove_diacritics folds "Beyoncé" to "beyonce";
+    # prefix indexes make search-as-you-type cheap.
+    # Skipped if this SQLite build lacks FTS5 (search falls back to LIKE).
+    # -----------------------------------------
+    try:
+        cursor.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS tracks_fts USING fts5(
+                title, artist, genre,
+                content = 'tracks',
+                content_rowid = 'id',
+                tokenize = 'unicode61 remove_diacritics 2',
+                prefix = '2 3'
+            )
+        """)
+    except sqlite3.OperationalError:
+        return
+
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS tracks_fts_insert AFTER INSERT ON tracks BEGIN
+            INSERT INTO tracks_fts (rowid, title, artist, genre)
+            VALUES (new.id, new.title, new.artist, new.genre);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS tracks_fts_delete AFTER DELETE ON tracks BEGIN
+            INSERT INTO tracks_fts (tracks_fts, rowid, title, artist, genre)
+            VALUES ('delete', old.id, old.title, old.artist, old.genre);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS tracks_fts_update AFTER UPDATE OF title, artist, genre ON tracks BEGIN
+            INSERT INTO tracks_fts (tracks_fts, rowid, title, artist, genre)
+            VALUES ('delete', old.id, old.title, old.artist, old.genre);
+            INSERT INTO tracks_fts (rowid, title, artist, genre)
+            VALUES (new.id, new.title, new.artist, new.genre);
+        END
+    """)
+
+    # Index the tracks that already exist
+    cursor.execute("INSERT INTO tracks_fts (tracks_fts) VALUES ('rebuild')")
+
+
+def _migration_smart_crates(cursor):
+    # -----------------------------------------
+    # Crates remember their filter (JSON) and when they were last
+    # refreshed; tracks record when their metadata last changed.
+    # Together they let a crate refresh touch only changed tracks.
+    # -----------------------------------------
+    cursor.execute("ALTER TABLE crates ADD COLUMN filters TEXT")
+    cursor.execute("ALTER TABLE crates ADD COLUMN refreshed_at REAL")
+
+    cursor.execute("ALTER TABLE tracks ADD COLUMN updated_at REAL")
+    cursor.execute(f"UPDATE tracks SET updated_at = {SQL_NOW}")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tracks_updated_at ON tracks (updated_at)")
+
+    # A track appears in a crate at most once
+    cursor.execute("""
+        DELETE FROM crate_tracks
+        WHERE rowid NOT IN (
+            SELECT MIN(rowid) FROM crate_tracks GROUP BY crate_id, track_id
+        )
+    """)
+    cursor.execute("DROP INDEX IF EXISTS idx_crate_tracks_crate")
+    cursor.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_crate_tracks_unique
+        ON crate_tracks (crate_id, track_id)
+    """)
+
+
+def _migration_camelot_keys(cursor):
+    # -----------------------------------------
+    # Canonical Camelot code next to the raw key tag, indexed so key
+    # crates and harmonic-neighbour lookups are single index queries.
+    # Backfilled once per distinct raw key, not once per track.
+    # -----------------------------------------
+    cursor.execute("ALTER TABLE tracks ADD COLUMN camelot_key TEXT")
+
+    cursor.execute("SELECT DISTINCT musical_key FROM tracks WHERE musical_key IS NOT NULL")
+    cursor.executemany(
+        "UPDATE tracks SET camelot_key = ? WHERE musical_key = ?",
+        [(normalize_key(key), key) for (key,) in cursor.fetchall()]
+    )
+
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tracks_camelot ON tracks (camelot_key)")
+
+
+def _migration_analysis_queue(cursor):
+    # -----------------------------------------
+    # Files imported by a metadata-only scan that still need
+    # BPM / key / fingerprint analysis. Rows leave the queue in the
+    # same transaction that stores their results.
+    # -----------------------------------------
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS analysis_queue (
+            filepath TEXT PRIMARY KEY,
+            queued_at REAL NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT
+        )
+    """)
+
+
+def _migration_scan_sessions(cursor):
+    # -----------------------------------------
+    # One row per folder scan. `cursor` is the walk-order path up to
+    # which every file is committed; it's written in the same
+    # transaction as the scan results, so an interrupted scan can
+    # resume right after it.
+    # -----------------------------------------
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS scan_sessions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            root TEXT NOT NULL,
+            fast_mode INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            cursor TEXT,
+            files_done INTEGER NOT NULL DEFAULT 0,
+            started_at REAL,
+            updated_at REAL,
+            finished_at REAL
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_scan_sessions_root ON scan_sessions (root, status)")
+
+
+def _migration_scanned_content(cursor):
+    # -----------------------------------------
+    # Audio identity of each scanned file, so a file that moved or was
+    # renamed can be matched to its old path by (content_hash, audio_size)
+    # instead of being analysed again. Older rows are filled in the
+    # next time a scan passes over them.
+    # -----------------------------------------
+    cursor.execute("ALTER TABLE scanned_files ADD COLUMN content_hash TEXT")
+    cursor.execute("ALTER TABLE scanned_files ADD COLUMN audio_size INTEGER")
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_scanned_files_content
+        ON scanned_files (content_hash, audio_size)
+    """)
+
+
+def _migration_fingerprint_index_track(cursor):
+    # Removing a track's index rows (prune, relink) without a full scan
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_fingerprint_index_track
+        ON fingerprint_index (track_id)
+    """)
+
+
+def _migration_track_quality(cursor):
+    # -----------------------------------------
+    # Stream quality of each track, used to keep the best copy when
+    # duplicates are cleaned up. The codec is backfilled from the file
+    # extension; bitrate, sample rate and duration are filled in the
+    # next time a scan passes over the file.
+    # The (title, artist, bpm) index serves the duplicate partitioning.
+    # -----------------------------------------
+    cursor.execute("ALTER TABLE tracks ADD COLUMN codec TEXT")
+    cursor.execute("ALTER TABLE tracks ADD COLUMN bitrate INTEGER")
+    cursor.execute("ALTER TABLE tracks ADD COLUMN sample_rate INTEGER")
+    cursor.execute("ALTER TABLE tracks ADD COLUMN duration REAL")
+
+    cursor.execute("SELECT id, filepath FROM tracks")
+    cursor.executemany(
+        "UPDATE tracks SET codec = ? WHERE id = ?",
+        [
+            (os.path.splitext(filepath)[1].lower().lstrip(".") or None, track_id)
+            for track_id, filepath in cursor.fetchall()
+            if filepath
+        ]
+    )
+
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_tracks_duplicates
+        ON tracks (title, artist, bpm)
+    """)
+
+
+def _migration_scanned_duplicates(cursor):
+    # -----------------------------------------
+    # The kept file each skipped duplicate is a copy of. When that file
+    # is pruned, its copies' scanned_files rows are dropped too, so the
+    # next scan adds one of them instead of skipping it as unchanged.
+    # -----------------------------------------
+    cursor.execute("ALTER TABLE scanned_files ADD COLUMN duplicate_of TEXT")
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_scanned_files_duplicate_of
+        ON scanned_files (duplicate_of) WHERE duplicate_of IS NOT NULL
+    """)
+
+
+MIGRATIONS = [
+    _migration_base_schema,         # 1
+    _migration_fingerprint_index,   # 2
+    _migration_analysis_cache,      # 3
+    _migration_unique_filepath,     # 4
+    _migration_secondary_indexes,   # 5
+    _migration_fulltext_search,     # 6
+    _migration_smart_crates,        # 7
+    _migration_camelot_keys,        # 8
+    _migration_analysis_queue,      # 9
+    _migration_scan_sessions,       # 10
+    _migration_scanned_content,     # 11
+    _migration_fingerprint_index_track,  # 12
+    _migration_track_quality,       # 13
+    _migration_scanned_duplicates,  # 14
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def get_schema_version() -> int:
+    return get_connection().execute("PRAGMA user_version").fetchone()[0]
+
+
+# ============================================================
+# Database Upgrade: runs any migrations not applied yet
+# ============================================================
+def upgrade_database():
+    version = get_schema_version()
+
+    # Up to date: nothing to run on a normal launch
+    if version >= SCHEMA_VERSION:
+        return
+
+    for number, migration in enumerate(MIGRATIONS, start=1):
+        if number <= version:
+            continue
+
+        with transaction() as conn:
+            migration(conn.cursor())
+            conn.execute(f"PRAGMA user_version = {number}")
+
+# ============================================================
+# Merge tracks rows that share a filepath
+# ============================================================
+def merge_duplicate_filepaths(cursor):
+    """
+    Collapses rows left behind by earlier rescans into the oldest row
+    for each filepath (so its ID and crate memberships survive), taking
+    the newest row's metadata.
+    """
+    cursor.execute("DROP TABLE IF EXISTS temp.track_merge")
+    cursor.execute("""
+        CREATE TEMP TABLE track_merge AS
+        SELECT tracks.id AS old_id, groups.keep_id, groups.newest_id
+        FROM tracks
+        JOIN (
+            SELECT filepath, MIN(id) AS keep_id, MAX(id) AS newest_id
+            FROM tracks
+            WHERE filepath IS NOT NULL
+            GROUP BY filepath
+            HAVING COUNT(*) > 1
+        ) AS groups ON tracks.filepath = groups.filepath
+        WHERE tracks.id <> groups.keep_id
+    """)
+
+    cursor.execute("""
+        UPDATE tracks SET (title, artist, bpm, musical_key, genre) = (
+            SELECT newest.title, newest.artist, newest.bpm, newest.musical_key, newest.genre
+            FROM tracks AS newest
+            WHERE newest.id = (SELECT MAX(newest_id) FROM track_merge WHERE keep_id = tracks.id)
+        )
+        WHERE id IN (SELECT keep_id FROM track_merge)
+    """)
+
+    cursor.execute("""
+        INSERT INTO crate_tracks (crate_id, track_id)
+        SELECT DISTINCT crate_tracks.crate_id, track_merge.keep_id
+        FROM crate_tracks
+        JOIN track_merge ON crate_tracks.track_id = track_merge.old_id
+        WHERE NOT EXISTS (
+            SELECT 1 FROM crate_tracks AS existing
+            WHERE existing.crate_id = crate_tracks.crate_id
+              AND existing.track_id = track_merge.keep_id
+        )
+    """)
+    cursor.execute("""
+        UPDATE fingerprints
+        SET track_id = (SELECT keep_id FROM track_merge WHERE old_id = fingerprints.track_id)
+        WHERE track_id IN (SELECT old_id FROM track_merge)
+    """)
+    cursor.execute("""
+        INSERT OR IGNORE INTO fingerprint_index (hash, track_id)
+        SELECT fingerprint_index.hash, track_merge.keep_id
+        FROM fingerprint_index
+        JOIN track_merge ON fingerprint_index.track_id = track_merge.old_id
+    """)
+
+    cursor.execute("DELETE FROM crate_tracks WHERE track_id IN (SELECT old_id FROM track_merge)")
+    cursor.execute("DELETE FROM fingerprint_index WHERE track_id IN (SELECT old_id FROM track_merge)")
+    cursor.execute("DELETE FROM tracks WHERE id IN (SELECT old_id FROM track_merge)")
+    cursor.execute("DROP TABLE temp.track_merge")
 
 
 # ============================================================
-# Retrieve scanned file info
+# Preload scanned files under a folder
 # ============================================================
-def get_scanned_file(filepath: str):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+def path_range(root: str) -> tuple[str, str]:
+    """
+    (lower, upper) bounds such that every path under `root` satisfies
+    lower <= path < upper: "root/" up to "root0" ("0" follows "/").
+    Lets an indexed filepath column be range-scanned instead of LIKE.
+    """
+    prefix = os.path.join(root, "")
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
 
+def load_scanned_files(root: str) -> dict[str, int]:
+    """
+    Returns {filepath: last_modified} for every scanned file under `root`.
+    Uses a range query on the filepath primary key instead of a LIKE scan.
+    """
+    prefix, upper = path_range(root)
+
+    cursor = get_connection().cursor()
     cursor.execute(
-        "SELECT last_modified, fingerprint FROM scanned_files WHERE filepath = ?",
-        (filepath,)
+        "SELECT filepath, last_modified FROM scanned_files WHERE filepath >= ? AND filepath < ?",
+        (prefix, upper)
     )
 
-    row = cursor.fetchone()
-    conn.close()
-    return row  # (last_modified, fingerprint) or None
+    return dict(cursor.fetchall())
+
+
+def load_backfill_files(root: str) -> set[str]:
+    """
+    Files under `root` scanned before some per-file data was stored:
+    no content hash, or a track with no stream quality yet.
+    """
+    prefix, upper = path_range(root)
+
+    cursor = get_connection().cursor()
+    cursor.execute("""
+        SELECT filepath FROM scanned_files
+        WHERE filepath >= ? AND filepath < ? AND content_hash IS NULL
+        UNION
+        SELECT filepath FROM tracks
+        WHERE filepath >= ? AND filepath < ? AND duration IS NULL
+    """, (prefix, upper, prefix, upper))
+
+    return {filepath for (filepath,) in cursor.fetchall()}
+
+
+def find_scanned_by_content(content_hash: str, audio_size: int) -> list[str]:
+    """
+    Scanned filepaths whose audio payload has this hash and size.
+    """
+    cursor = get_connection().cursor()
+
+    cursor.execute("""
+        SELECT filepath FROM scanned_files
+        WHERE content_hash = ? AND audio_size = ?
+    """, (content_hash, audio_size))
+
+    return [filepath for (filepath,) in cursor.fetchall()]
+
+
+# Used by ScanWriter; content is (content_hash, audio_size) or (None, None)
+SCANNED_UPSERT = """
+    INSERT INTO scanned_files (filepath, last_modified, fingerprint, content_hash, audio_size)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(filepath) DO UPDATE SET
+        last_modified = excluded.last_modified,
+        fingerprint = excluded.fingerprint,
+        content_hash = COALESCE(excluded.content_hash, content_hash),
+        audio_size = COALESCE(excluded.audio_size, audio_size),
+        duplicate_of = NULL
+"""
 
 
 # ============================================================
-# Insert or update scanned file entry
+# Analysis cache
 # ============================================================
-def update_scanned_file(filepath: str, last_modified: int, fingerprint: str | None):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+def get_cached_analysis(content_hash: str, audio_size: int, analyzer_version: int):
+    """
+    Returns (bpm, musical_key, fingerprint) cached for this audio payload
+    by the same analyzer version, or None.
+    """
+    cursor = get_connection().cursor()
 
     cursor.execute("""
-        INSERT INTO scanned_files (filepath, last_modified, fingerprint)
-        VALUES (?, ?, ?)
-        ON CONFLICT(filepath) DO UPDATE SET
-            last_modified = excluded.last_modified,
-            fingerprint = excluded.fingerprint
-    """, (filepath, last_modified, fingerprint))
+        SELECT bpm, musical_key, fingerprint
+        FROM analysis_cache
+        WHERE content_hash = ? AND audio_size = ? AND analyzer_version = ?
+    """, (content_hash, audio_size, analyzer_version))
+
+    return cursor.fetchone()
 
-    conn.commit()
-    conn.close()
+
+# Newer analyzer versions replace a row; the same version fills in gaps
+CACHE_UPSERT = """
+    INSERT INTO analysis_cache
+        (content_hash, audio_size, analyzer_version, bpm, musical_key, fingerprint)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT(content_hash, audio_size) DO UPDATE SET
+        bpm = CASE WHEN analyzer_version = excluded.analyzer_version
+                   THEN COALESCE(excluded.bpm, bpm) ELSE excluded.bpm END,
+        musical_key = CASE WHEN analyzer_version = excluded.analyzer_version
+                   THEN COALESCE(excluded.musical_key, musical_key) ELSE excluded.musical_key END,
+        fingerprint = CASE WHEN analyzer_version = excluded.analyzer_version
+                   THEN COALESCE(excluded.fingerprint, fingerprint) ELSE excluded.fingerprint END,
+        analyzer_version = excluded.analyzer_version
+"""
 
 
 # ============================================================
-# Check if fingerprint already exists
+# Analysis queue
+# ============================================================
+# Requeueing a changed file gives it a fresh set of attempts
+QUEUE_INSERT = f"""
+    INSERT INTO analysis_queue (filepath, queued_at)
+    VALUES (?, {SQL_NOW})
+    ON CONFLICT(filepath) DO UPDATE SET
+        attempts = 0,
+        last_error = NULL
+"""
+
+QUEUE_FAILED = """
+    UPDATE analysis_queue
+    SET attempts = attempts + 1, last_error = ?
+    WHERE filepath = ?
+"""
+
+
+def load_analysis_queue(max_attempts: int = MAX_QUEUE_ATTEMPTS) -> list[str]:
+    """
+    Returns queued filepaths still worth retrying, oldest first.
+    """
+    cursor = get_connection().cursor()
+
+    cursor.execute("""
+        SELECT filepath FROM analysis_queue
+        WHERE attempts < ?
+        ORDER BY queued_at, filepath
+    """, (max_attempts,))
+
+    return [filepath for (filepath,) in cursor.fetchall()]
+
+
+def count_analysis_queue() -> int:
+    cursor = get_connection().cursor()
+    cursor.execute("SELECT COUNT(*) FROM analysis_queue")
+    return cursor.fetchone()[0]
+
+
+def remove_from_analysis_queue(filepaths: list[str]):
+    with transaction() as conn:
+        conn.cursor().executemany(
+            "DELETE FROM analysis_queue WHERE filepath = ?",
+            [(filepath,) for filepath in filepaths]
+        )
+
+
+# ============================================================
+# Check if fingerprint (or a near-duplicate of it) already exists
 # ============================================================
 def fingerprint_exists(fingerprint: str) -> int | None:
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    cursor = get_connection().cursor()
 
     cursor.execute(
         "SELECT track_id FROM fingerprints WHERE fingerprint = ?",
@@ -88,22 +612,49 @@ def fingerprint_exists(fingerprint: str) -> int | None:
     )
 
     row = cursor.fetchone()
-    conn.close()
-    return row[0] if row else None
+    if row:
+        return row[0]
 
+    return find_matching_track(fingerprint)
 
-# ============================================================
-# Insert fingerprint → track mapping
-# ============================================================
-def insert_fingerprint(fingerprint: str, track_id: int):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
 
-    cursor.execute("""
-        INSERT OR IGNORE INTO fingerprints (fingerprint, track_id)
-        VALUES (?, ?)
-    """, (fingerprint, track_id))
+def find_matching_track(fingerprint: str) -> int | None:
+    """
+    Near-duplicate lookup: candidate tracks sharing sub-fingerprints are
+    pulled from the inverted index, then verified by bit error rate.
+    """
+    # Imported here: fingerprint needs numpy, which the menu never loads
+    from dj_library_manager.fingerprint import index_hashes, fingerprints_match
+
+    hashes = index_hashes(fingerprint, step=1)
+    if not hashes:
+        return None
+
+    cursor = get_connection().cursor()
+
+    placeholders = ",".join("?" * len(hashes))
+    cursor.execute(f"""
+        SELECT track_id, COUNT(*) AS hits
+        FROM fingerprint_index
+        WHERE hash IN ({placeholders})
+        GROUP BY track_id
+        ORDER BY hits DESC
+        LIMIT ?
+    """, (*hashes, MAX_FINGERPRINT_CANDIDATES))
+
+    for track_id, _ in cursor.fetchall():
+        cursor.execute(
+            "SELECT fingerprint FROM fingerprints WHERE track_id = ?",
+            (track_id,)
+        )
+        for (candidate,) in cursor.fetchall():
+            if fingerprints_match(fingerprint, candidate):
+                return track_id
+
+    return None
+
 
-    conn.commit()
-    conn.close()
+def fingerprint_index_rows(fingerprint: str, track_id: int) -> list[tuple[int, int]]:
+    from dj_library_manager.fingerprint import index_hashes
 
+    return [(h, track_id) for h in index_hashes(fingerprint)]
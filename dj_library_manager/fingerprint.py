@@ -1,70 +1,172 @@
-
 # fingerprint.py
 #
-# Generates a stable audio fingerprint for duplicate detection.
+# Generates a perceptual audio fingerprint for duplicate detection.
 # Uses:
-# - pydub for audio loading
+# - librosa, through AnalysisContext, for audio loading (the same
+#   decoder the scanner uses, so a window's fingerprint doesn't
+#   depend on the caller)
 # - numpy for signal processing
 #
 # The fingerprint is based on the first 30 seconds of audio.
-# This is enough to uniquely identify a track while keeping it fast.
+# Only that window (plus a small margin) is ever decoded, so time and
+# memory per fingerprint don't grow with track length.
+# Each frame becomes one 32-bit sub-fingerprint: the signs of the
+# energy differences between neighbouring frequency bands, compared
+# with the previous frame. Those bits survive re-encoding, bitrate
+# changes and volume changes, so copies of a track produce nearly the
+# same fingerprint and can be matched by Hamming distance.
+#
+# librosa is imported when audio is first decoded;
+# matching fingerprints only needs numpy.
 
-from pydub import AudioSegment
 import numpy as np
-import hashlib
+
+FINGERPRINT_SAMPLE_RATE = 22050
+FINGERPRINT_WINDOW_MS = 30000
+
+# Decoded past the window so resampling near the cut matches a full decode
+DECODE_MARGIN_MS = 1000
+
+FRAME_SIZE = 4096          # ~186 ms analysis window
+HOP_SIZE = 1024            # ~46 ms between sub-fingerprints
+BAND_EDGES_HZ = np.geomspace(300, 2000, 34)   # 33 bands -> 32 bits
+
+SILENCE_THRESHOLD = 0.1    # relative to peak amplitude
+
+# Matching
+INDEX_STEP = 8             # index every 8th sub-fingerprint
+MAX_SHIFT = 16             # frames of misalignment tolerated when comparing
+MIN_OVERLAP = 20           # frames needed for a meaningful comparison
+MATCH_THRESHOLD = 0.35     # bit error rate below which two tracks match
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
 
 
 # ============================================================
 # Load audio and return normalized sample array
 # ============================================================
-def load_audio(filepath: str, max_ms: int = 30000):
+def load_audio(filepath: str, max_ms: int = FINGERPRINT_WINDOW_MS):
     """
-    Loads the first `max_ms` milliseconds of audio.
+    Loads the first `max_ms` milliseconds of audio as a mono buffer at
+    FINGERPRINT_SAMPLE_RATE, exactly as a scan's AnalysisContext does.
     Returns a numpy array of samples, or None on failure.
     """
-    try:
-        audio = AudioSegment.from_file(filepath)
+    # Imported here: analysis pulls in librosa and imports this module
+    from dj_library_manager.analysis import AnalysisContext
+
+    return AnalysisContext(filepath, sr=FINGERPRINT_SAMPLE_RATE).head(max_ms)
+
+
+# ============================================================
+# Sub-fingerprints
+# ============================================================
+def compute_subfingerprints(samples) -> np.ndarray:
+    """
+    Returns one uint32 sub-fingerprint per frame (may be empty).
+    `samples` is a mono buffer at FINGERPRINT_SAMPLE_RATE.
+    """
+    samples = np.asarray(samples, dtype=np.float32)
 
-        # Normalize format
-        audio = audio.set_channels(1)          # mono for consistency
-        audio = audio.set_frame_rate(22050)    # downsample for speed
+    # Skip leading silence so encoder delay / padding doesn't shift frames
+    peak = np.max(np.abs(samples)) if len(samples) else 0.0
+    if peak <= 0:
+        return np.empty(0, dtype=np.uint32)
 
-        # Trim to first 30 seconds
-        audio = audio[:max_ms]
+    start = int(np.argmax(np.abs(samples) > peak * SILENCE_THRESHOLD))
+    samples = samples[start:]
 
-        samples = np.array(audio.get_array_of_samples()).astype(np.float32)
-        return samples
+    if len(samples) < FRAME_SIZE + HOP_SIZE:
+        return np.empty(0, dtype=np.uint32)
 
-    except Exception:
-        return None
+    # Framed power spectrum
+    frames = np.lib.stride_tricks.sliding_window_view(samples, FRAME_SIZE)[::HOP_SIZE]
+    spectrum = np.abs(np.fft.rfft(frames * np.hanning(FRAME_SIZE).astype(np.float32), axis=1)) ** 2
+
+    # Energy per band: (frames, 33)
+    freqs = np.fft.rfftfreq(FRAME_SIZE, 1.0 / FINGERPRINT_SAMPLE_RATE)
+    band_index = np.digitize(freqs, BAND_EDGES_HZ) - 1
+    valid = (band_index >= 0) & (band_index < len(BAND_EDGES_HZ) - 1)
+
+    energy = np.zeros((spectrum.shape[0], len(BAND_EDGES_HZ) - 1), dtype=np.float64)
+    np.add.at(energy.T, band_index[valid], spectrum[:, valid].T)
+
+    # Bit m of frame n: sign of the band-difference change over time
+    band_diff = energy[:, :-1] - energy[:, 1:]
+    bits = (band_diff[1:] - band_diff[:-1]) > 0
+
+    weights = (1 << np.arange(31, -1, -1, dtype=np.uint64))
+    return (bits.astype(np.uint64) @ weights).astype(np.uint32)
+
+
+def encode_fingerprint(subfingerprints: np.ndarray) -> str:
+    return subfingerprints.astype(">u4").tobytes().hex()
+
+
+def decode_fingerprint(fingerprint: str) -> np.ndarray:
+    return np.frombuffer(bytes.fromhex(fingerprint), dtype=">u4").astype(np.uint32)
 
 
 # ============================================================
-# Generate fingerprint hash
+# Generate fingerprint
 # ============================================================
-def generate_fingerprint(filepath: str) -> str | None:
+def generate_fingerprint(filepath: str, samples=None) -> str | None:
     """
-    Generates a stable fingerprint hash for the audio file.
-    Returns a hex string or None if audio can't be read.
+    Generates a perceptual fingerprint for the audio file.
+    `samples` may be an already-decoded mono buffer of the first
+    FINGERPRINT_WINDOW_MS at FINGERPRINT_SAMPLE_RATE; if omitted the
+    file is decoded here.
+    Returns a hex string of sub-fingerprints, or None if audio can't be read.
     """
-    samples = load_audio(filepath)
+    if samples is None:
+        samples = load_audio(filepath)
 
     if samples is None or len(samples) == 0:
         return None
 
-    # Normalize amplitude
-    samples = samples / (np.max(np.abs(samples)) + 1e-9)
+    subfingerprints = compute_subfingerprints(samples)
+    if len(subfingerprints) < MIN_OVERLAP:
+        return None
+
+    return encode_fingerprint(subfingerprints)
+
 
-    # Downsample further for hashing
-    reduced = samples[::100]  # take every 100th sample
+# ============================================================
+# Matching
+# ============================================================
+def index_hashes(fingerprint: str, step: int = INDEX_STEP) -> list[int]:
+    """
+    Sub-fingerprints stored in the inverted index (every `step`-th frame).
+    Pass step=1 to get every hash, as used for lookups.
+    """
+    subfingerprints = decode_fingerprint(fingerprint)[::step]
+    return sorted({int(h) for h in subfingerprints if h != 0})
+
+
+def bit_error_rate(a: str, b: str, max_shift: int = MAX_SHIFT) -> float:
+    """
+    Lowest fraction of differing bits between two fingerprints over
+    small time shifts. 0.0 = identical, ~0.5 = unrelated.
+    """
+    x = decode_fingerprint(a)
+    y = decode_fingerprint(b)
+    best = 1.0
 
-    # Convert to bytes
-    data_bytes = reduced.tobytes()
+    for shift in range(-max_shift, max_shift + 1):
+        if shift >= 0:
+            xs, ys = x[shift:], y
+        else:
+            xs, ys = x, y[-shift:]
 
-    # Hash using SHA‑1 (fast + stable)
-    fingerprint = hashlib.sha1(data_bytes).hexdigest()
+        n = min(len(xs), len(ys))
+        if n < MIN_OVERLAP:
+            continue
 
-    return fingerprint
+        diff = np.bitwise_xor(xs[:n], ys[:n])
+        errors = int(_POPCOUNT[diff.view(np.uint8)].sum())
+        best = min(best, errors / (32 * n))
 
+    return best
 
 
+def fingerprints_match(a: str, b: str) -> bool:
+    return bit_error_rate(a, b) < MATCH_THRESHOLD
@@ -0,0 +1,190 @@
+# fuzzy_duplicates.py
+#
+# Near-duplicate detection on metadata, for copies the exact
+# (title, artist, bpm) match misses:
+#   "Artist feat. X – Song (Extended Mix)" at 128 BPM
+#   "Artist – Song" at 127 BPM
+#
+# Tracks are blocked by lead artist and BPM bucket, so only tracks that
+# could plausibly match are compared; oversized artist blocks are split
+# by the first title word. Within a bucket, titles are compared as
+# character-trigram sets with one matrix product (Jaccard similarity for
+# every pair at once), and matching pairs are joined into clusters.
+
+from collections import defaultdict
+
+import numpy as np
+
+from dj_library_manager.database import get_tracks
+from dj_library_manager.metadata_utils import artist_match_key, title_match_key
+
+# Trigram Jaccard similarity for two titles to count as the same track
+SIMILARITY_THRESHOLD = 0.7
+
+# Copies can differ by this much BPM (rounding, re-analysis)
+BPM_TOLERANCE = 2
+
+# Tracks are compared with their own bucket and the next one up,
+# which covers every pair within BPM_TOLERANCE
+BPM_BUCKET = BPM_TOLERANCE + 1
+
+# Artist blocks larger than this are split by the first word of the title
+MAX_BLOCK = 2000
+
+# Rows compared per matrix product, to bound memory on large buckets
+CHUNK_ROWS = 1024
+
+
+def trigrams(text: str) -> set[str]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def trigram_matrix(grams: list[set[str]]) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Binary trigram matrix (one row per title) and per-row trigram counts.
+    """
+    vocabulary = {}
+    rows, cols = [], []
+    for row, title_grams in enumerate(grams):
+        for gram in title_grams:
+            rows.append(row)
+            cols.append(vocabulary.setdefault(gram, len(vocabulary)))
+
+    matrix = np.zeros((len(grams), len(vocabulary)), dtype=np.float32)
+    matrix[rows, cols] = 1.0
+    return matrix, matrix.sum(axis=1)
+
+
+def title_similarity(rows_a, rows_b, matrix, sizes) -> np.ndarray:
+    """
+    Jaccard similarity between every row of `rows_a` and `rows_b`, given
+    a binary trigram matrix and per-row trigram counts.
+    """
+    intersection = matrix[rows_a] @ matrix[rows_b].T
+    union = sizes[rows_a][:, None] + sizes[rows_b][None, :] - intersection
+    return intersection / np.maximum(union, 1)
+
+
+def block_pairs(block, threshold: float):
+    """
+    Yields (i, j, similarity) for matching tracks of one artist block.
+    `block` is a list of (track_index, title_key, bpm).
+    """
+    grams = [trigrams(title_key) for _, title_key, _ in block]
+    bpms = np.array([np.nan if bpm is None else bpm for _, _, bpm in block], dtype=np.float64)
+
+    # Bucket -1 holds tracks without a BPM; they are compared with every track
+    buckets = defaultdict(list)
+    for row, bpm in enumerate(bpms):
+        buckets[-1 if np.isnan(bpm) else int(bpm // BPM_BUCKET)].append(row)
+
+    for bucket, rows_a in buckets.items():
+        if bucket == -1:
+            others = [row for row in range(len(block)) if not np.isnan(bpms[row])]
+        else:
+            others = buckets.get(bucket + 1, [])
+
+        # Only the rows being compared go into the matrix: the bucket
+        # itself first, then the neighbouring rows
+        members = np.array(rows_a + others)
+        matrix, sizes = trigram_matrix([grams[row] for row in members])
+        size_a = len(rows_a)
+        bpm_b = bpms[members][None, :]
+
+        for start in range(0, size_a, CHUNK_ROWS):
+            chunk = np.arange(start, min(start + CHUNK_ROWS, size_a))
+
+            similarity = title_similarity(chunk, slice(None), matrix, sizes)
+
+            bpm_a = bpm_b[0, chunk][:, None]
+            close = np.isnan(bpm_a) | np.isnan(bpm_b) | (np.abs(bpm_a - bpm_b) <= BPM_TOLERANCE)
+
+            # Each pair once: inside the bucket only i < j
+            once = np.ones_like(close)
+            once[:, :size_a] = chunk[:, None] < np.arange(size_a)[None, :]
+
+            matches = (similarity >= threshold) & close & once
+
+            # A track without a BPM joins only its best match among tracks
+            # with one, so it can't bridge copies whose BPMs are far apart
+            if bucket == -1 and others:
+                tail = np.where(matches[:, size_a:], similarity[:, size_a:], -1.0)
+                best = tail.argmax(axis=1)
+                keep = np.zeros_like(tail, dtype=bool)
+                keep[np.arange(len(chunk)), best] = True
+                matches[:, size_a:] &= keep
+
+            for a, b in np.argwhere(matches):
+                yield members[chunk[a]], members[b], float(similarity[a, b])
+
+
+def split_block(block):
+    """
+    Splits an oversized artist block ("Various Artists", a label name)
+    by the first word of the title; copies of one track share it.
+    """
+    parts = defaultdict(list)
+    for entry in block:
+        parts[entry[1].split(maxsplit=1)[0]].append(entry)
+    return list(parts.values())
+
+
+def find_near_duplicates(tracks=None, threshold: float = SIMILARITY_THRESHOLD):
+    """
+    Ranked clusters of probable duplicates, best match first.
+    Returns a list of {"score", "tracks"}, where score is the mean
+    title similarity of the cluster's matching pairs and tracks are
+    rows as returned by get_tracks().
+    """
+    if tracks is None:
+        tracks = get_tracks()
+
+    blocks = defaultdict(list)
+    for index, track in enumerate(tracks):
+        artist_key = artist_match_key(track[2])
+        title_key = title_match_key(track[1])
+
+        # Nothing to block or compare on
+        if artist_key and title_key:
+            blocks[artist_key].append((index, title_key, track[3]))
+
+    # Union-find over track indexes
+    parent = {}
+
+    def find(i):
+        parent.setdefault(i, i)
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    edges = []
+    for block in blocks.values():
+        for part in (split_block(block) if len(block) > MAX_BLOCK else [block]):
+            if len(part) < 2:
+                continue
+
+            for a, b, similarity in block_pairs(part, threshold):
+                i, j = part[a][0], part[b][0]
+                parent[find(i)] = find(j)
+                edges.append((i, similarity))
+
+    members = defaultdict(list)
+    for i in parent:
+        members[find(i)].append(i)
+
+    scores = defaultdict(list)
+    for i, similarity in edges:
+        scores[find(i)].append(similarity)
+
+    clusters = [
+        {
+            "score": round(sum(scores[root]) / len(scores[root]), 3),
+            "tracks": [tracks[i] for i in sorted(indexes)],
+        }
+        for root, indexes in members.items()
+    ]
+
+    clusters.sort(key=lambda cluster: (-cluster["score"], -len(cluster["tracks"])))
+    return clusters
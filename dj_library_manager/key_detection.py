@@ -0,0 +1,70 @@
+# key_detection.py
+#
+# Major/minor key estimation by template matching.
+# The average chroma of a few analysis windows is correlated against
+# all 24 Krumhansl-Kessler key profiles (12 major, 12 minor rotations)
+# in one matrix product; the best-correlated template is the key.
+
+import librosa
+import numpy as np
+
+from dj_library_manager.analysis import analysis_windows
+from dj_library_manager.metadata_utils import camelot_from_pitch
+
+PITCH_NAMES = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"]
+
+# Krumhansl & Kessler (1982) probe-tone ratings, tonic first
+MAJOR_PROFILE = np.array([6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88])
+MINOR_PROFILE = np.array([6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17])
+
+KEY_WINDOW_SECONDS = 20
+KEY_MAX_WINDOWS = 3
+CHROMA_HOP = 2048
+
+
+def _zscore(rows: np.ndarray) -> np.ndarray:
+    rows = rows - rows.mean(axis=-1, keepdims=True)
+    std = rows.std(axis=-1, keepdims=True)
+    return np.divide(rows, std, out=np.zeros_like(rows), where=std > 0)
+
+
+# (24, 12): rows 0-11 major keys on C..B, rows 12-23 minor keys on C..B
+_TEMPLATES = _zscore(np.stack(
+    [np.roll(MAJOR_PROFILE, tonic) for tonic in range(12)]
+    + [np.roll(MINOR_PROFILE, tonic) for tonic in range(12)]
+))
+
+
+def key_scores(profiles: np.ndarray) -> np.ndarray:
+    """
+    Pearson correlation of each 12-bin chroma profile with every key
+    template: (windows, 12) -> (windows, 24).
+    """
+    return _zscore(np.atleast_2d(profiles)) @ _TEMPLATES.T / 12
+
+
+def estimate_key(samples, sr: int, max_windows: int = KEY_MAX_WINDOWS) -> dict | None:
+    """
+    Returns {"key": "Am", "confidence": 0..1, "camelot": "8A"}, or None
+    for silent/undecodable audio. Confidence is the winning template's
+    correlation, averaged over the analysed windows.
+    """
+    windows = analysis_windows(samples, sr, KEY_WINDOW_SECONDS, max_windows)
+
+    profiles = np.stack([
+        librosa.feature.chroma_cqt(y=w, sr=sr, hop_length=CHROMA_HOP).mean(axis=1)
+        for w in windows
+    ])
+
+    if not np.any(profiles):
+        return None
+
+    scores = key_scores(profiles).mean(axis=0)
+    best = int(scores.argmax())
+    tonic, minor = best % 12, best >= 12
+
+    return {
+        "key": PITCH_NAMES[tonic] + ("m" if minor else ""),
+        "confidence": float(np.clip(scores[best], 0.0, 1.0)),
+        "camelot": camelot_from_pitch(tonic, minor),
+    }
@@ -1,8 +1,14 @@
 # logging_utils.py
 #
-# Color-coded console output using Rich + traditional file logging.
+# Color-coded console output using Rich + buffered JSON-lines file
+# logging on a background thread.
 
+import atexit
+import json
 import os
+import queue
+import threading
+import time
 from datetime import datetime
 from rich.console import Console
 from rich.text import Text
@@ -30,45 +36,239 @@ def mode(message: str, fast: bool = False):
 
 
 # ============================================================
-# Log file setup (unchanged)
+# Log file
+# JSON lines, written by one background thread: callers only put a
+# record on a queue. The thread batches records and writes them every
+# FLUSH_INTERVAL seconds or BUFFER_LINES records, rotates the file by
+# size, and flushes at exit. Nothing touches the disk until the first
+# record, so importing this module creates no directory.
 # ============================================================
-LOG_DIR = "logs"
+LOG_DIR = os.environ.get("DJ_LIBRARY_LOG_DIR", "logs")
 LOG_FILE = os.path.join(LOG_DIR, "scan.log")
 
-if not os.path.exists(LOG_DIR):
-    os.makedirs(LOG_DIR)
+FLUSH_INTERVAL = 1.0           # seconds
+BUFFER_LINES = 500
+MAX_BYTES = 5 * 1024 * 1024    # rotate scan.log past this size
+BACKUP_COUNT = 3               # scan.log.1 … scan.log.3
+
+DEBUG, INFO, WARNING, ERROR = 10, 20, 30, 40
+LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARNING", ERROR: "ERROR"}
+
+_STOP = object()
+
+
+def _level_from_env() -> int:
+    name = os.environ.get("DJ_LIBRARY_LOG_LEVEL", "INFO").strip().upper()
+    levels = {value: level for level, value in LEVEL_NAMES.items()}
+    return levels.get(name, INFO)
+
+
+class LogWriter:
+    def __init__(
+        self,
+        path: str = LOG_FILE,
+        level: int = INFO,
+        flush_interval: float = FLUSH_INTERVAL,
+        buffer_lines: int = BUFFER_LINES,
+        max_bytes: int = MAX_BYTES,
+        backup_count: int = BACKUP_COUNT,
+    ):
+        self.path = path
+        self.level = level
+        self.flush_interval = flush_interval
+        self.buffer_lines = buffer_lines
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+
+        self._lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._file = None
+
+    # ============================================================
+    # Caller side
+    # ============================================================
+    def write(self, level: int, event: str | None, message: str, fields: dict):
+        if level < self.level:
+            return
+        self._ensure_started()
+        self._queue.put((time.time(), level, event, message, fields))
+
+    def flush(self, timeout: float | None = 5.0):
+        """
+        Blocks until everything logged so far is on disk.
+        """
+        if not self._running():
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def close(self, timeout: float | None = 5.0):
+        if not self._running():
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _running(self) -> bool:
+        return self._thread is not None and self._pid == os.getpid()
+
+    def _ensure_started(self):
+        if self._running():
+            return
+
+        with self._lock:
+            if self._running():
+                return
+
+            # A forked scan worker inherits the parent's writer but not
+            # its thread; it starts its own
+            self._queue = queue.SimpleQueue()
+            self._file = None
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+            self._thread.start()
+
+    # ============================================================
+    # Writer thread
+    # ============================================================
+    def _run(self):
+        pending = []
+        last_flush = time.monotonic()
+
+        while True:
+            if pending:
+                timeout = max(0.0, self.flush_interval - (time.monotonic() - last_flush))
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    item = None
+            else:
+                # Idle: sleep until the next record, and count the flush
+                # interval from it
+                item = self._queue.get()
+                last_flush = time.monotonic()
+
+            if item is _STOP or isinstance(item, threading.Event):
+                self._write(pending)
+                pending = []
+                last_flush = time.monotonic()
+
+                if item is _STOP:
+                    self._close_file()
+                    return
+                item.set()
+                continue
+
+            if item is not None:
+                pending.append(self._format(*item))
+
+            if pending and (
+                len(pending) >= self.buffer_lines
+                or time.monotonic() - last_flush >= self.flush_interval
+            ):
+                self._write(pending)
+                pending = []
+                last_flush = time.monotonic()
+
+    @staticmethod
+    def _format(timestamp, level, event, message, fields) -> str:
+        record = {
+            "time": datetime.fromtimestamp(timestamp).isoformat(timespec="milliseconds"),
+            "level": LEVEL_NAMES.get(level, str(level)),
+        }
+        if event:
+            record["event"] = event
+        record["message"] = message
+        record.update(fields)
+        return json.dumps(record, ensure_ascii=False, default=str) + "\n"
+
+    def _write(self, lines):
+        if not lines:
+            return
+
+        # Logging must never break a scan: disk errors drop the batch
+        try:
+            if self._file is None:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._file = open(self.path, "a", encoding="utf-8")
+
+            self._file.write("".join(lines))
+            self._file.flush()
+
+            if self._file.tell() >= self.max_bytes:
+                self._rotate()
+        except OSError:
+            self._close_file()
+
+    def _rotate(self):
+        self._close_file()
+
+        for index in range(self.backup_count - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+    def _close_file(self):
+        if self._file is not None:
+            try:
+                self._file.close()
+            except OSError:
+                pass
+            self._file = None
+
+
+_writer = LogWriter(level=_level_from_env())
+atexit.register(_writer.close)
 
 
 # ============================================================
 # Core file logging
 # ============================================================
-def log(message: str):
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    entry = f"{timestamp}: {message}"
+def log(message: str, level: int = INFO, event: str | None = None, **fields):
+    """
+    Queues one JSON line for scan.log; `fields` are added to the record.
+    """
+    _writer.write(level, event, message, fields)
+
 
-    with open(LOG_FILE, "a", encoding="utf-8") as f:
-        f.write(entry + "\n")
+def flush_log():
+    _writer.flush()
 
 
 # ============================================================
-# Convenience helpers (unchanged)
+# Convenience helpers
 # ============================================================
 def log_added(filepath: str):
-    log(f"Added track: {filepath}")
+    log(f"Added track: {filepath}", INFO, "added", filepath=filepath)
+
+def log_updated(filepath: str):
+    log(f"Updated track: {filepath}", INFO, "updated", filepath=filepath)
+
+def log_moved(old_filepath: str, filepath: str):
+    log(f"Moved track: {old_filepath} -> {filepath}", INFO, "moved",
+        filepath=filepath, old_filepath=old_filepath)
 
 def log_duplicate(filepath: str):
-    log(f"Duplicate skipped: {filepath}")
+    log(f"Duplicate skipped: {filepath}", INFO, "duplicate", filepath=filepath)
 
 def log_missing_bpm(filepath: str):
-    log(f"Missing BPM: {filepath}")
+    log(f"Missing BPM: {filepath}", WARNING, "missing_bpm", filepath=filepath)
 
 def log_missing_key(filepath: str):
-    log(f"Missing key: {filepath}")
+    log(f"Missing key: {filepath}", WARNING, "missing_key", filepath=filepath)
 
 def log_missing_genre(filepath: str):
-    log(f"Missing genre: {filepath}")
+    log(f"Missing genre: {filepath}", WARNING, "missing_genre", filepath=filepath)
 
 def log_error(filepath: str, error: str):
-    log(f"Error reading {filepath}: {error}")
-
-
+    log(f"Error reading {filepath}: {error}", ERROR, "error", filepath=filepath, error=error)
@@ -1,24 +1,34 @@
+# main.py
+#
+# Interactive menu. Only light modules (SQLite access, crate and search
+# helpers) are imported up front; scanning and analysis pull in
+# librosa / numpy / soundfile, so those modules are imported by the menu
+# actions that use them. `python -m dj_library_manager.startup_benchmark`
+# checks this.
+
 import argparse
 from dj_library_manager import __version__
-from dj_library_manager.db_upgrade import upgrade_database
-from dj_library_manager.update_checker import check_for_updates
+from dj_library_manager.db_upgrade import upgrade_database, count_analysis_queue
+from dj_library_manager.connection import set_db_path
 
 from dj_library_manager.database import (
-    init_db,
     auto_crate,
+    refresh_all_crates,
+    count_tracks_by_key,
+    find_harmonic_matches,
     get_crates,
     get_tracks,
     get_tracks_in_crate,
-    search_by_artist,
-    search_by_title,
+    search_tracks,
     format_track,
     show_tracks_missing_bpm,
     show_tracks_missing_genre,
     find_duplicates,
+    plan_duplicate_cleanup,
     delete_duplicate_tracks,
 )
 
-from dj_library_manager.audio_reader import scan_folder
+from dj_library_manager.prune import prune_folder
 from collections import Counter
 
 
@@ -34,6 +44,27 @@ def parse_args():
         help="Show the installed version and exit"
     )
 
+    parser.add_argument(
+        "--no-update-check",
+        action="store_true",
+        help="Don't check PyPI for a newer release (or set DJ_LIBRARY_NO_UPDATE_CHECK=1)"
+    )
+
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        metavar="N",
+        help="Number of worker processes used for scanning (default: number of CPU cores)"
+    )
+
+    parser.add_argument(
+        "--db",
+        default=None,
+        metavar="PATH",
+        help="Library database file (default: $DJ_LIBRARY_DB or dj_library.db)"
+    )
+
     return parser.parse_args()
 
 
@@ -148,34 +179,78 @@ def create_key_crates():
         "12A / 12B": ["12A", "12B"],
     }
 
-    tracks = get_tracks()
+    counts = count_tracks_by_key()
 
     for name, keys in camelot_groups.items():
-        matching = [t for t in tracks if t[4] in keys]
-        if matching:
-            auto_crate(name=f"Key Group {name}")
+        if any(counts.get(k) for k in keys):
+            auto_crate(name=f"Key Group {name}", key=keys)
 
     print("Key‑compatible crates created!")
 
 
+def refresh_smart_crates(full=False):
+    counts = refresh_all_crates(full=full)
+    if counts:
+        print(f"Refreshed {len(counts)} smart crates.")
+
+
+# ============================================================
+# DUPLICATE CLEANUP PLAN
+# ============================================================
+def describe_copy(copy):
+    track_id, filepath, codec, bitrate, sample_rate, duration = copy
+
+    details = [codec or "?"]
+    if bitrate:
+        details.append(f"{bitrate // 1000} kbps")
+    if sample_rate:
+        details.append(f"{sample_rate / 1000:g} kHz")
+    if duration:
+        details.append(f"{int(duration // 60)}:{int(duration % 60):02d}")
+
+    return f"[{track_id}] {filepath} ({', '.join(details)})"
+
+
+def show_duplicate_plan(plan, limit=20):
+    removed = sum(len(group["remove"]) for group in plan)
+    print(f"\n{len(plan)} duplicate groups, {removed} copies to remove:")
+    print("-" * 40)
+
+    for group in plan[:limit]:
+        print(f"{group['artist']} – {group['title']} | {group['bpm']} BPM")
+        print(f"  keep:   {describe_copy(group['keep'])}")
+        for copy in group["remove"]:
+            print(f"  remove: {describe_copy(copy)}")
+        print("-" * 40)
+
+    if len(plan) > limit:
+        print(f"... and {len(plan) - limit} more groups")
+
+
 # ============================================================
 # MAIN MENU
 # ============================================================
 def main():
     args = parse_args()
 
-    # Check for updates before doing anything else
-    check_for_updates()
-
     if args.version:
         print(f"DJ Library Manager v{__version__}")
         return
 
-    init_db()
+    # Runs in the background (at most once a day); never delays the menu
+    from dj_library_manager.update_checker import start_update_check, show_update_notice
+    update_check = start_update_check(enabled=not args.no_update_check)
+
+    if args.db:
+        set_db_path(args.db)
+
     upgrade_database()
     print(">>> RUNNING CORRECT MAIN.PY <<<")
 
     while True:
+        if update_check and show_update_notice(update_check):
+            update_check = None
+
         print("\n=== DJ Library Manager ===")
         print("1. Scan music folder")
         print("2. View all tracks")
@@ -188,14 +263,22 @@ def main():
         print("9. Exit")
         print("10. Show duplicate tracks")
         print("11. Auto‑delete duplicates")
-        print("12. Fast Scan (no fingerprinting)")
+        print("12. Fast Scan (tags only, analysis queued)")
+        print("13. Refresh smart crates")
+        print("14. Find harmonic mixes for a track")
+        print(f"15. Analyze queued tracks ({count_analysis_queue()} waiting)")
+        print("16. Remove missing files from library")
+        print("17. Find near‑duplicate tracks")
 
         choice = input("Choose an option: ")
 
         # 1 — Full Scan
         if choice == "1":
             folder = input("Enter folder path to scan: ")
-            scan_folder(folder)
+
+            from dj_library_manager.audio_reader import scan_folder
+            scan_folder(folder, workers=args.workers)
+            refresh_smart_crates()
 
         # 2 — View All Tracks
         elif choice == "2":
@@ -231,14 +314,12 @@ def main():
 
         # 4 — Search
         elif choice == "4":
-            term = input("Search term (artist/title): ")
+            term = input("Search term (artist/title/genre): ")
 
-            print("\nArtist matches:")
-            for t in search_by_artist(term):
-                print(format_track(t))
+            results = search_tracks(term)
 
-            print("\nTitle matches:")
-            for t in search_by_title(term):
+            print(f"\n{len(results)} matches:")
+            for t in results:
                 print(format_track(t))
 
         # 5 — Create Auto‑Crate
@@ -294,19 +375,84 @@ def main():
 
         # 11 — Auto‑Delete Duplicates
         elif choice == "11":
-            removed = delete_duplicate_tracks()
-            print(f"\nRemoved {removed} duplicate tracks.\n")
+            plan = plan_duplicate_cleanup()
+
+            if not plan:
+                print("\nNo duplicates found.\n")
+                continue
+
+            show_duplicate_plan(plan)
+
+            confirm = input("Delete these copies? (y/N): ")
+            if confirm.strip().lower() == "y":
+                removed = delete_duplicate_tracks()
+                print(f"\nRemoved {removed} duplicate tracks.\n")
 
         # 12 — Fast Scan
         elif choice == "12":
            folder = input("Enter folder path to scan: ")
-           report = scan_folder(folder, fast_mode=True)
+
+           from dj_library_manager.audio_reader import scan_folder
+           report = scan_folder(folder, fast_mode=True, workers=args.workers)
+           refresh_smart_crates()
 
            print("\n=== Fast Scan Complete ===")
            print(f"Scanned: {report.total_scanned}")
            print(f"Added: {report.added}")
+           print(f"Updated: {report.updated}")
            print(f"Duplicates: {report.duplicates}")
            print(f"Unreadable: {report.unreadable}")
            print(f"Missing BPM: {report.missing_bpm}")
            print(f"Missing Key: {report.missing_key}")
            print(f"Missing Genre: {report.missing_genre}")
+           print(f"Queued for analysis: {report.queued} (run option 15)")
+
+        # 13 — Refresh Smart Crates
+        elif choice == "13":
+            refresh_smart_crates(full=True)
+
+        # 14 — Harmonic Mixes
+        elif choice == "14":
+            track_id = input("Track ID: ")
+
+            try:
+                matches = find_harmonic_matches(int(track_id))
+            except ValueError:
+                print("Invalid input.")
+                continue
+
+            print(f"\n{len(matches)} compatible tracks:")
+            for t in matches:
+                print(format_track(t))
+
+        # 15 — Analyze Queue
+        elif choice == "15":
+            from dj_library_manager.audio_reader import analyze_queue
+            analyze_queue(workers=args.workers)
+            refresh_smart_crates()
+
+        # 16 — Prune Missing Files
+        elif choice == "16":
+            folder = input("Enter folder path to check: ")
+            removed = prune_folder(folder)
+            print(f"\nRemoved {removed} missing tracks.\n")
+
+        # 17 — Near‑Duplicates
+        elif choice == "17":
+            from dj_library_manager.fuzzy_duplicates import find_near_duplicates
+            clusters = find_near_duplicates()
+
+            if not clusters:
+                print("\nNo near‑duplicates found.\n")
+                continue
+
+            print(f"\n{len(clusters)} possible duplicate groups (best matches first):")
+            print("-" * 40)
+            for cluster in clusters[:25]:
+                print(f"Similarity: {cluster['score']:.0%}")
+                for t in cluster["tracks"]:
+                    print(f"  {format_track(t)}")
+                print("-" * 40)
+
+            if len(clusters) > 25:
+                print(f"... and {len(clusters) - 25} more groups")
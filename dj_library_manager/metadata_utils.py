@@ -7,10 +7,15 @@
 # - genre normalization
 # - BPM extraction
 # - key extraction
+# - key normalization (any notation -> Camelot code)
+# - audio quality (codec, bitrate, sample rate, duration)
+# - match keys for fuzzy duplicate detection
 #
 # Used by audio_reader.py to keep metadata clean and consistent.
 
 import os
+import re
+import unicodedata
 
 
 # ============================================================
@@ -136,6 +141,87 @@ def extract_key(tags) -> str | None:
     return None
 
 
+# ============================================================
+# Key normalization
+# Maps Camelot ("8A"), Open Key ("1m"), note names ("Am", "A minor",
+# "Bbmaj", "F♯m") and detector output ("C#", treated as major) to a
+# canonical Camelot code: 1-12 plus A (minor) or B (major).
+# ============================================================
+NOTE_PITCHES = {"c": 0, "d": 2, "e": 4, "f": 5, "g": 7, "a": 9, "b": 11}
+ACCIDENTALS = {"": 0, "#": 1, "♯": 1, "b": -1, "♭": -1}
+MAJOR_SUFFIXES = {"", "maj", "major"}
+MINOR_SUFFIXES = {"m", "min", "minor"}
+
+_CAMELOT_RE = re.compile(r"^(\d{1,2})\s*([ab])$")
+_OPEN_KEY_RE = re.compile(r"^(\d{1,2})\s*([dm])$")
+_NOTE_RE = re.compile(r"^([a-g])\s*([#♯b♭]?)\s*(.*)$")
+
+
+def camelot_from_pitch(pitch_class: int, minor: bool) -> str:
+    """
+    Camelot code for a key given its tonic pitch class (C = 0).
+    """
+    # Minor keys share a number with their relative major
+    major_pitch = (pitch_class + 3) % 12 if minor else pitch_class % 12
+    number = (major_pitch * 7 + 7) % 12 + 1   # circle of fifths, C major = 8B
+    return f"{number}{'A' if minor else 'B'}"
+
+
+def normalize_key(key: str | None) -> str | None:
+    if not key:
+        return None
+
+    value = clean_whitespace(str(key)).lower()
+
+    match = _CAMELOT_RE.match(value)
+    if match:
+        number = int(match.group(1))
+        if 1 <= number <= 12:
+            return f"{number}{match.group(2).upper()}"
+        return None
+
+    match = _OPEN_KEY_RE.match(value)
+    if match:
+        number = int(match.group(1))
+        if 1 <= number <= 12:
+            # Open Key 1d = C major = Camelot 8B
+            return f"{(number + 6) % 12 + 1}{'A' if match.group(2) == 'm' else 'B'}"
+        return None
+
+    match = _NOTE_RE.match(value)
+    if match:
+        note, accidental, mode = match.groups()
+        mode = mode.strip()
+        pitch = NOTE_PITCHES[note] + ACCIDENTALS[accidental]
+
+        if mode in MAJOR_SUFFIXES:
+            return camelot_from_pitch(pitch, minor=False)
+        if mode in MINOR_SUFFIXES:
+            return camelot_from_pitch(pitch, minor=True)
+
+    return None
+
+
+def harmonic_neighbors(camelot: str | None) -> list[str]:
+    """
+    Keys that mix cleanly with `camelot`: itself, one step either way
+    round the wheel, and its relative major/minor.
+    """
+    camelot = normalize_key(camelot)
+    if not camelot:
+        return []
+
+    number, letter = int(camelot[:-1]), camelot[-1]
+    other = "B" if letter == "A" else "A"
+
+    return [
+        camelot,
+        f"{(number - 2) % 12 + 1}{letter}",
+        f"{number % 12 + 1}{letter}",
+        f"{number}{other}",
+    ]
+
+
 # ============================================================
 # Genre extraction
 # ============================================================
@@ -194,4 +280,100 @@ def extract_artist(tags) -> str | None:
     return None
 
 
+# ============================================================
+# Audio quality
+# Read from the stream header mutagen has already parsed; used to
+# decide which copy of a duplicate to keep.
+# ============================================================
+LOSSLESS_CODECS = ("flac", "wav", "aiff", "alac")
+
+
+def extract_quality(audio, filepath: str) -> tuple:
+    """
+    (codec, bitrate, sample_rate, duration) for a mutagen file object.
+    Codec comes from the extension, except for MP4 containers, which
+    can hold either AAC or ALAC. Unknown values are None.
+    """
+    codec = os.path.splitext(filepath)[1].lower().lstrip(".") or None
+    info = getattr(audio, "info", None)
+
+    if info is None:
+        return codec, None, None, None
+
+    mp4_codec = getattr(info, "codec", None)
+    if codec == "m4a" and mp4_codec:
+        codec = "alac" if mp4_codec == "alac" else "aac"
+
+    bitrate = getattr(info, "bitrate", None) or None
+    sample_rate = getattr(info, "sample_rate", None) or None
+    duration = getattr(info, "length", None) or None
+
+    return (
+        codec,
+        int(bitrate) if bitrate else None,
+        int(sample_rate) if sample_rate else None,
+        round(float(duration), 3) if duration else None,
+    )
+
+
+# ============================================================
+# Match keys
+# Aggressive normalisation used only to compare tracks, never stored:
+# case, accents, punctuation, featured artists and version tags
+# that don't change the arrangement ("Extended Mix", "Radio Edit")
+# are dropped. Named remixes are kept; they are different tracks.
+# ============================================================
+FEATURING = re.compile(r"\s*[\(\[]?\b(?:feat|ft|featuring)\b\.?.*$", re.IGNORECASE)
+TITLE_FEATURING = re.compile(
+    r"[\(\[]\s*(?:feat|ft|featuring)\b[^\)\]]*[\)\]]|\s\b(?:feat|ft|featuring)\b\.?.*$",
+    re.IGNORECASE,
+)
+# Lower-case "x" only: "Artist x Other", not "DJ X"
+ARTIST_SEPARATORS = re.compile(r"\s*(?:,|&|\+|/|;|(?-i:\bx\b)|\band\b|\bvs\b\.?|\bwith\b)\s*", re.IGNORECASE)
+
+_VERSION = r"(?:original|extended|radio|club|clean|dirty|explicit|album|single)\s+(?:mix|edit|version)"
+VERSION_TAG = re.compile(
+    rf"[\(\[][^\)\]]*\b{_VERSION}\b[^\)\]]*[\)\]]"
+    r"|[\(\[][^\)\]]*\bremaster(?:ed)?\b[^\)\]]*[\)\]]"
+    rf"|\s+-\s+{_VERSION}\s*$",
+    re.IGNORECASE,
+)
+
+
+def _fold(text: str) -> str:
+    # lower case, accents stripped, punctuation to spaces
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    text = re.sub(r"[^\w\s]", " ", text)
+    return " ".join(text.split())
+
+
+def artist_match_key(artist: str | None) -> str | None:
+    """
+    The lead artist, folded: "Artist feat. X" and "Artist & Y" -> "artist".
+    """
+    if not artist:
+        return None
+
+    artist = FEATURING.sub("", artist)
+    artist = ARTIST_SEPARATORS.split(artist, maxsplit=1)[0]
+    artist = _fold(artist)
+
+    if artist.startswith("the "):
+        artist = artist[4:]
+
+    return artist or None
+
+
+def title_match_key(title: str | None) -> str | None:
+    """
+    The title, folded, without featured artists or plain version tags.
+    """
+    if not title:
+        return None
+
+    title = VERSION_TAG.sub(" ", title)
+    title = TITLE_FEATURING.sub(" ", title)
+
+    return _fold(title) or None
 
@@ -0,0 +1,74 @@
+# prune.py
+#
+# Removes library entries for files that no longer exist.
+# Missing files are found with one set difference: the paths the
+# library knows under a folder minus the paths a walk of that folder
+# actually found. No per-row os.path.exists calls.
+# Paths under a directory the walk couldn't read are never judged: a
+# transient network-drive error must not look like a deleted folder.
+#
+# Used:
+# - at the end of every completed folder scan (the scan's walk is reused)
+# - on its own, from the menu
+
+import os
+
+from dj_library_manager.database import load_library_paths, delete_files
+from dj_library_manager.walker import walk_audio_files, walk_key
+
+
+def is_under(path: str, directories: set[str]) -> bool:
+    # True if `path` or one of its parent directories is in `directories`
+    while path not in directories:
+        parent = os.path.dirname(path)
+        if parent == path:
+            return False
+        path = parent
+    return True
+
+
+def find_missing_files(root: str, seen: set[str], start_after: str | None = None,
+                       unreadable: set[str] = frozenset()) -> set[str]:
+    """
+    Library paths under `root` that the walk didn't see.
+    `start_after` is the checkpoint a resumed walk started from; paths
+    up to it weren't walked this time, so they aren't judged. Nor are
+    paths under the walk's `unreadable` directories and files.
+    """
+    missing = load_library_paths(root) - seen
+
+    if start_after:
+        after = walk_key(root, start_after)
+        missing = {path for path in missing if walk_key(root, path) > after}
+
+    if unreadable:
+        missing = {path for path in missing if not is_under(path, unreadable)}
+
+    return missing
+
+
+def prune_missing_files(root: str, seen: set[str], start_after: str | None = None,
+                        unreadable: set[str] = frozenset()) -> int:
+    """
+    Deletes every row belonging to files under `root` that are gone.
+    Returns the number of tracks removed.
+    """
+    # A folder that vanished entirely is more likely an unmounted drive
+    # than a deleted library; never prune it.
+    if not os.path.isdir(root) or not seen:
+        return 0
+
+    missing = find_missing_files(root, seen, start_after, unreadable)
+    if not missing:
+        return 0
+
+    return delete_files(missing)
+
+
+def prune_folder(root: str) -> int:
+    """
+    Standalone prune: walks `root` and removes entries for missing files.
+    """
+    unreadable = set()
+    seen = {path for path, _, _ in walk_audio_files(root, unreadable=unreadable)}
+    return prune_missing_files(root, seen, unreadable=unreadable)
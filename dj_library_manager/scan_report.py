@@ -10,19 +10,35 @@ console = Console()
 # Used by audio_reader.py to report:
 # - total scanned
 # - new tracks added
+# - existing tracks updated (changed files)
+# - unchanged files skipped
 # - duplicates skipped
 # - missing metadata
 # - unreadable files
+# - audio decodes per analyzed file
+# - analysis cache hits / misses
+# - files queued for deferred analysis
+# - moved / renamed files relinked without re-analysis
+# - deleted files pruned from the library
 
 class ScanReport:
     def __init__(self):
         self.total_scanned = 0
         self.added = 0
+        self.updated = 0
+        self.skipped = 0
         self.duplicates = 0
         self.missing_bpm = 0
         self.missing_key = 0
         self.missing_genre = 0
         self.unreadable = 0
+        self.analyzed = 0
+        self.decodes = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.queued = 0
+        self.moved = 0
+        self.pruned = 0
 
     # ============================================================
     # Increment helpers
@@ -33,6 +49,12 @@ class ScanReport:
     def inc_added(self):
         self.added += 1
 
+    def inc_updated(self):
+        self.updated += 1
+
+    def inc_skipped(self):
+        self.skipped += 1
+
     def inc_duplicate(self):
         self.duplicates += 1
 
@@ -48,6 +70,36 @@ class ScanReport:
     def inc_unreadable(self):
         self.unreadable += 1
 
+    def inc_analyzed(self, decodes: int):
+        self.analyzed += 1
+        self.decodes += decodes
+
+    def inc_cache(self, hit: bool):
+        if hit:
+            self.cache_hits += 1
+        else:
+            self.cache_misses += 1
+
+    def inc_moved(self):
+        self.moved += 1
+
+    def set_pruned(self, count: int):
+        self.pruned = count
+
+    def inc_queued(self):
+        self.queued += 1
+
+    def cache_hit_rate(self) -> float:
+        lookups = self.cache_hits + self.cache_misses
+        if not lookups:
+            return 0.0
+        return self.cache_hits / lookups * 100
+
+    def decodes_per_file(self) -> float:
+        if not self.analyzed:
+            return 0.0
+        return self.decodes / self.analyzed
+
     # ============================================================
     # Summary formatting
     # ============================================================
@@ -56,11 +108,18 @@ class ScanReport:
             "=== Scan Summary ===",
             f"Total scanned: {self.total_scanned}",
             f"New tracks added: {self.added}",
+            f"Updated: {self.updated}",
+            f"Unchanged (skipped): {self.skipped}",
+            f"Moved / renamed: {self.moved}",
+            f"Removed (missing): {self.pruned}",
             f"Duplicates skipped: {self.duplicates}",
             f"Missing BPM: {self.missing_bpm}",
             f"Missing Key: {self.missing_key}",
             f"Missing Genre: {self.missing_genre}",
             f"Unreadable files: {self.unreadable}",
+            f"Decodes per file: {self.decodes_per_file():.2f}",
+            f"Analysis cache: {self.cache_hits} hits / {self.cache_misses} misses ({self.cache_hit_rate():.0f}%)",
+            f"Queued for analysis: {self.queued}",
         ]
         return "\n".join(lines)
 
@@ -73,11 +132,21 @@ class ScanReport:
         table.add_row("Mode:", mode)
         table.add_row("Total scanned:", str(self.total_scanned))
         table.add_row("New tracks added:", str(self.added))
+        table.add_row("Updated:", str(self.updated))
+        table.add_row("Unchanged (skipped):", str(self.skipped))
+        table.add_row("Moved / renamed:", str(self.moved))
+        table.add_row("Removed (missing):", str(self.pruned))
         table.add_row("Duplicates skipped:", str(self.duplicates))
         table.add_row("Missing BPM:", str(self.missing_bpm))
         table.add_row("Missing Key:", str(self.missing_key))
         table.add_row("Missing Genre:", str(self.missing_genre))
         table.add_row("Unreadable files:", str(self.unreadable))
+        table.add_row("Decodes per file:", f"{self.decodes_per_file():.2f}")
+        table.add_row(
+            "Analysis cache:",
+            f"{self.cache_hits} hits / {self.cache_misses} misses ({self.cache_hit_rate():.0f}%)",
+        )
+        table.add_row("Queued for analysis:", str(self.queued))
         table.add_row("Time:", f"{elapsed:.2f}s")
 
         panel = Panel(
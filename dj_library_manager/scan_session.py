@@ -0,0 +1,106 @@
+# scan_session.py
+#
+# Checkpointed scan sessions.
+# A folder scan records a session row; as batches are committed the
+# session's cursor advances to the last walk-order path whose results
+# (and those of every file before it) are in the database. An
+# interrupted or crashed scan of the same folder resumes from there:
+# the walker skips everything up to the cursor without listing or
+# stat'ing it.
+
+from collections import deque
+
+from dj_library_manager.connection import get_connection, transaction
+from dj_library_manager.db_upgrade import SQL_NOW
+
+# Written by ScanWriter.flush, in the same transaction as the results
+SESSION_CHECKPOINT = f"""
+    UPDATE scan_sessions
+    SET cursor = ?, files_done = ?, updated_at = {SQL_NOW}
+    WHERE id = ?
+"""
+
+
+# ============================================================
+# Sessions
+# ============================================================
+def find_resumable_session(root: str, fast_mode: bool):
+    """
+    Returns (session_id, cursor, files_done) of the latest unfinished
+    scan of `root` in the same mode, or None.
+    """
+    cursor = get_connection().cursor()
+
+    cursor.execute("""
+        SELECT id, cursor, files_done
+        FROM scan_sessions
+        WHERE root = ? AND fast_mode = ? AND status != 'finished'
+        ORDER BY id DESC
+        LIMIT 1
+    """, (root, int(fast_mode)))
+
+    return cursor.fetchone()
+
+
+def start_session(root: str, fast_mode: bool) -> int:
+    with transaction() as conn:
+        cursor = conn.cursor()
+
+        cursor.execute(f"""
+            INSERT INTO scan_sessions (root, fast_mode, status, started_at, updated_at)
+            VALUES (?, ?, 'running', {SQL_NOW}, {SQL_NOW})
+        """, (root, int(fast_mode)))
+
+        return cursor.lastrowid
+
+
+def set_session_status(session_id: int, status: str):
+    """
+    'running' and 'interrupted' sessions can be resumed; 'finished' can't.
+    """
+    finished = SQL_NOW if status == "finished" else "NULL"
+
+    with transaction() as conn:
+        conn.cursor().execute(f"""
+            UPDATE scan_sessions
+            SET status = ?, updated_at = {SQL_NOW}, finished_at = {finished}
+            WHERE id = ?
+        """, (status, session_id))
+
+
+# ============================================================
+# Progress tracking
+# ============================================================
+class ScanProgress:
+    """
+    Tracks which walked files are finished. Parallel scans finish files
+    out of order, so the checkpoint is the end of the contiguous run
+    of finished files, in walk order.
+    """
+
+    def __init__(self, session_id: int | None = None, cursor: str | None = None, files_done: int = 0):
+        self.session_id = session_id
+        self.cursor = cursor
+        self.files_done = files_done
+
+        self._in_order = deque()     # walked paths not yet behind the cursor
+        self._finished = set()
+        self._saved = (cursor, files_done)
+
+    def started(self, filepath: str):
+        self._in_order.append(filepath)
+
+    def finished(self, filepath: str):
+        self._finished.add(filepath)
+
+        while self._in_order and self._in_order[0] in self._finished:
+            self.cursor = self._in_order.popleft()
+            self._finished.discard(self.cursor)
+            self.files_done += 1
+
+    def checkpoint_due(self) -> bool:
+        return self.session_id is not None and (self.cursor, self.files_done) != self._saved
+
+    def checkpoint_row(self) -> tuple:
+        self._saved = (self.cursor, self.files_done)
+        return (self.cursor, self.files_done, self.session_id)
@@ -0,0 +1,314 @@
+# scan_writer.py
+#
+# Buffered writer for scan results.
+# Collects:
+# - track rows (upserted by filepath)
+# - fingerprint → track links
+# - scanned_files upserts (and which file a skipped duplicate copies)
+# - content hash / stream quality backfills for unchanged files
+# - relocations of moved / renamed files (and their re-read tags)
+# - analysis_cache upserts
+# - analysis_queue changes (queued, finished, failed files)
+# - the scan session checkpoint
+#
+# and flushes them with executemany in a single transaction every
+# `batch_size` files or `flush_interval` seconds, whichever comes first.
+# Used as a context manager so pending work is flushed on cancel/error.
+
+import time
+
+from dj_library_manager.connection import transaction
+from dj_library_manager.db_upgrade import (
+    fingerprint_exists,
+    fingerprint_index_rows,
+    CACHE_UPSERT,
+    SCANNED_UPSERT,
+    QUEUE_INSERT,
+    QUEUE_FAILED,
+)
+from dj_library_manager.database import (
+    TRACK_UPSERT,
+    TRACK_ANALYSIS_UPDATE,
+    TRACK_TAGS_UPDATE,
+    get_track_filepath,
+    track_exists,
+)
+from dj_library_manager.fingerprint import index_hashes, fingerprints_match
+from dj_library_manager.metadata_utils import normalize_key
+from dj_library_manager.scan_session import ScanProgress, SESSION_CHECKPOINT
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_FLUSH_INTERVAL = 5.0
+
+
+class ScanWriter:
+    def __init__(
+        self,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        progress: ScanProgress | None = None,
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.progress = progress or ScanProgress()
+
+        self._tracks = []          # (title, artist, bpm, key, camelot_key, genre, codec, bitrate, sample_rate, duration, filepath)
+        self._fingerprints = []    # (fingerprint, filepath)
+        self._analysis = []        # (bpm, key, camelot_key, filepath) for existing rows only
+        self._scanned = {}         # filepath -> (filepath, last_modified, fingerprint, content_hash, audio_size)
+        self._duplicates = []      # (duplicate_of, filepath) for skipped duplicates
+        self._hashed = []          # (content_hash, audio_size, filepath) for unchanged files
+        self._quality = []         # (codec, bitrate, sample_rate, duration, filepath) for unchanged files
+        self._relocations = []     # (new_filepath, last_modified, old_filepath)
+        self._retagged = []        # TRACK_TAGS_UPDATE rows for relocated tracks
+        self._moved_from = {}      # old path -> new path, claimed during this scan (never reset)
+        self._cache = []           # analysis_cache rows
+        self._queued = []          # (filepath,) needing deferred analysis
+        self._dequeued = []        # (filepath,) analysed
+        self._failed = []          # (error, filepath)
+        self._pending_fingerprints = {}   # fingerprint -> filepath
+        self._pending_index = {}          # sub-fingerprint hash -> [(fingerprint, filepath)]
+
+        self._files_since_flush = 0
+        self._last_flush = time.monotonic()
+        self.flushes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Flush even when cancelled so finished work is never lost
+        self.flush()
+        return False
+
+    # ============================================================
+    # Buffering
+    # ============================================================
+    def add_track(self, title, artist, genre, bpm, key, filepath, quality=(None, None, None, None)):
+        self._tracks.append((title, artist, bpm, key, normalize_key(key), genre, *quality, filepath))
+
+    def update_analysis(self, filepath, bpm, key):
+        self._analysis.append((bpm, key, normalize_key(key), filepath))
+
+    def add_fingerprint(self, fingerprint: str, filepath: str):
+        self._fingerprints.append((fingerprint, filepath))
+        self._pending_fingerprints[fingerprint] = filepath
+
+        for h in index_hashes(fingerprint):
+            self._pending_index.setdefault(h, []).append((fingerprint, filepath))
+
+    def mark_scanned(self, filepath: str, last_modified: int, fingerprint: str | None, content=None):
+        content_hash, audio_size = content or (None, None)
+        self._scanned[filepath] = (filepath, last_modified, fingerprint, content_hash, audio_size)
+
+    def mark_duplicate(self, filepath: str, duplicate_of: str):
+        # Call after mark_scanned; the upsert clears duplicate_of
+        self._duplicates.append((duplicate_of, filepath))
+
+    def set_content(self, filepath: str, content):
+        self._hashed.append((*content, filepath))
+
+    def set_quality(self, filepath: str, quality):
+        self._quality.append((*quality, filepath))
+
+    def relocate(self, old_filepath: str, filepath: str, last_modified: int) -> bool:
+        """
+        Moves the track, scanned_files and queue rows of `old_filepath`
+        to `filepath`. Returns False if another file already claimed
+        that old path in this scan (a second copy of a moved file).
+        """
+        if old_filepath in self._moved_from:
+            return False
+
+        self._moved_from[old_filepath] = filepath
+        self._relocations.append((filepath, last_modified, old_filepath))
+        return True
+
+    def retag(self, filepath, title, artist, genre, bpm, key, quality=(None, None, None, None)):
+        # Tags of a relocated track, applied after the relocation
+        self._retagged.append((title, artist, genre, bpm, key, normalize_key(key), *quality, filepath))
+
+    def moved_to(self, old_filepath: str) -> str | None:
+        # Where a file claimed by relocate() in this scan now lives
+        return self._moved_from.get(old_filepath)
+
+    def cache_analysis(self, content_hash, audio_size, analyzer_version, bpm, key, fingerprint):
+        self._cache.append((content_hash, audio_size, analyzer_version, bpm, key, fingerprint))
+
+    def queue_analysis(self, filepath: str):
+        self._queued.append((filepath,))
+
+    def analysis_done(self, filepath: str):
+        self._dequeued.append((filepath,))
+
+    def analysis_failed(self, filepath: str, error: str):
+        self._failed.append((error, filepath))
+
+    def duplicate_of(self, fingerprint: str, filepath: str) -> str | None:
+        """
+        The path of a different file whose fingerprint matches (or nearly
+        matches) this one, either stored or waiting to be flushed.
+        A rescanned file matching its own earlier fingerprint is not a duplicate.
+        """
+        owner = self._pending_fingerprints.get(fingerprint)
+        if owner is not None and owner != filepath:
+            return owner
+
+        track_id = fingerprint_exists(fingerprint)
+        if track_id is not None:
+            owner = get_track_filepath(track_id)
+            if owner is not None and owner != filepath:
+                return owner
+
+        candidates = set()
+        for h in index_hashes(fingerprint, step=1):
+            candidates.update(self._pending_index.get(h, ()))
+
+        for candidate, owner in candidates:
+            if owner != filepath and fingerprints_match(fingerprint, candidate):
+                return owner
+
+        return None
+
+    def has_track(self, filepath: str) -> bool:
+        """
+        True if `filepath` already has a track row, stored or waiting to
+        be flushed (its upsert updates that row rather than adding one).
+        """
+        return any(row[-1] == filepath for row in self._tracks) or track_exists(filepath)
+
+    def file_done(self):
+        """
+        Call once per stored (or skipped) file; flushes when the batch is due.
+        """
+        self._files_since_flush += 1
+
+        if (
+            self._files_since_flush >= self.batch_size
+            or time.monotonic() - self._last_flush >= self.flush_interval
+        ):
+            self.flush()
+
+    # ============================================================
+    # Flush
+    # ============================================================
+    def flush(self) -> dict[str, int]:
+        """
+        Writes everything buffered in one transaction, together with the
+        scan checkpoint, so a file's track, fingerprint and scanned_files
+        rows are committed (or lost) as a unit.
+        Returns {filepath: track_id} for the tracks written.
+        """
+        track_ids = {}
+
+        has_work = (
+            self._relocations or self._retagged or self._tracks or self._analysis or self._scanned or self._duplicates
+            or self._hashed or self._quality or self._cache or self._dequeued or self._failed
+        )
+
+        if has_work or self.progress.checkpoint_due():
+            with transaction() as conn:
+                cursor = conn.cursor()
+
+                # Relocate first so this batch's upserts see the new paths.
+                # OR IGNORE: if the new path already has rows, keep them.
+                moves = [(new, old) for new, _, old in self._relocations]
+                cursor.executemany("UPDATE OR IGNORE tracks SET filepath = ? WHERE filepath = ?", moves)
+                cursor.executemany("UPDATE OR IGNORE analysis_queue SET filepath = ? WHERE filepath = ?", moves)
+                cursor.executemany("""
+                    UPDATE OR IGNORE scanned_files SET filepath = ?, last_modified = ?
+                    WHERE filepath = ?
+                """, self._relocations)
+                cursor.executemany("UPDATE scanned_files SET duplicate_of = ? WHERE duplicate_of = ?", moves)
+                cursor.executemany(TRACK_TAGS_UPDATE, self._retagged)
+
+                if self._tracks:
+                    cursor.executemany(TRACK_UPSERT, self._tracks)
+                    track_ids = self._resolve_track_ids(cursor)
+
+                cursor.executemany(TRACK_ANALYSIS_UPDATE, self._analysis)
+
+                if self._fingerprints:
+                    links = [
+                        (fingerprint, track_ids[filepath])
+                        for fingerprint, filepath in self._fingerprints
+                        if filepath in track_ids
+                    ]
+
+                    # A rescanned track's new fingerprint replaces its old one
+                    relinked = [(track_id,) for _, track_id in links]
+                    cursor.executemany("DELETE FROM fingerprints WHERE track_id = ?", relinked)
+                    cursor.executemany("DELETE FROM fingerprint_index WHERE track_id = ?", relinked)
+
+                    cursor.executemany("""
+                        INSERT OR REPLACE INTO fingerprints (fingerprint, track_id)
+                        VALUES (?, ?)
+                    """, links)
+
+                    cursor.executemany("""
+                        INSERT OR IGNORE INTO fingerprint_index (hash, track_id)
+                        VALUES (?, ?)
+                    """, [
+                        row
+                        for fingerprint, track_id in links
+                        for row in fingerprint_index_rows(fingerprint, track_id)
+                    ])
+
+                cursor.executemany(SCANNED_UPSERT, list(self._scanned.values()))
+                cursor.executemany("UPDATE scanned_files SET duplicate_of = ? WHERE filepath = ?", self._duplicates)
+                cursor.executemany("""
+                    UPDATE scanned_files SET content_hash = ?, audio_size = ?
+                    WHERE filepath = ?
+                """, self._hashed)
+                cursor.executemany("""
+                    UPDATE tracks SET codec = ?, bitrate = ?, sample_rate = ?, duration = ?
+                    WHERE filepath = ?
+                """, self._quality)
+
+                cursor.executemany(CACHE_UPSERT, self._cache)
+
+                cursor.executemany(QUEUE_INSERT, self._queued)
+                cursor.executemany("DELETE FROM analysis_queue WHERE filepath = ?", self._dequeued)
+                cursor.executemany(QUEUE_FAILED, self._failed)
+
+                if self.progress.checkpoint_due():
+                    cursor.execute(SESSION_CHECKPOINT, self.progress.checkpoint_row())
+
+            self.flushes += 1
+
+        self._tracks = []
+        self._fingerprints = []
+        self._analysis = []
+        self._scanned = {}
+        self._duplicates = []
+        self._hashed = []
+        self._quality = []
+        self._relocations = []
+        self._retagged = []
+        self._cache = []
+        self._queued = []
+        self._dequeued = []
+        self._failed = []
+        self._pending_fingerprints = {}
+        self._pending_index = {}
+        self._files_since_flush = 0
+        self._last_flush = time.monotonic()
+
+        return track_ids
+
+    def _resolve_track_ids(self, cursor) -> dict[str, int]:
+        # One join against a temp table instead of a lookup per file
+        cursor.execute("CREATE TEMP TABLE IF NOT EXISTS scan_batch (filepath TEXT PRIMARY KEY)")
+        cursor.execute("DELETE FROM scan_batch")
+        cursor.executemany(
+            "INSERT OR IGNORE INTO scan_batch (filepath) VALUES (?)",
+            [(row[-1],) for row in self._tracks]
+        )
+
+        cursor.execute("""
+            SELECT tracks.filepath, tracks.id
+            FROM scan_batch
+            JOIN tracks ON tracks.filepath = scan_batch.filepath
+        """)
+
+        return dict(cursor.fetchall())
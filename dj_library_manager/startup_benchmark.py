@@ -0,0 +1,126 @@
+# startup_benchmark.py
+#
+# Import-time breakdown of the CLI, to catch startup regressions.
+# Imports the entry module in a fresh interpreter with `-X importtime`,
+# reports the slowest imports and fails if any heavy analysis
+# dependency is loaded before a scan actually runs.
+#
+#   python -m dj_library_manager.startup_benchmark
+#   python -m dj_library_manager.startup_benchmark --runs 10 --budget-ms 150
+
+import argparse
+import re
+import statistics
+import subprocess
+import sys
+
+# Loaded by scans / analysis only; never at startup
+HEAVY_MODULES = ("librosa", "numpy", "scipy", "numba", "pydub", "soundfile", "sklearn")
+
+DEFAULT_MODULE = "dj_library_manager.main"
+DEFAULT_RUNS = 5
+DEFAULT_TOP = 15
+
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$")
+
+
+def parse_importtime(output: str) -> list[dict]:
+    """
+    Entries from `-X importtime` stderr, in the order the imports finished:
+    {"module", "self_us", "cumulative_us", "depth"}.
+    """
+    entries = []
+
+    for line in output.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+
+        self_us, cumulative_us, indent, module = match.groups()
+        entries.append({
+            "module": module,
+            "self_us": int(self_us),
+            "cumulative_us": int(cumulative_us),
+            "depth": (len(indent) - 1) // 2,
+        })
+
+    return entries
+
+
+def measure_imports(module: str = DEFAULT_MODULE) -> list[dict]:
+    """
+    Imports `module` in a new interpreter and returns its import entries.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+    )
+
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr.strip()}")
+
+    return parse_importtime(result.stderr)
+
+
+def heavy_imports(entries: list[dict]) -> list[str]:
+    loaded = {entry["module"].split(".")[0] for entry in entries}
+    return [name for name in HEAVY_MODULES if name in loaded]
+
+
+def total_ms(entries: list[dict], module: str) -> float:
+    for entry in entries:
+        if entry["module"] == module:
+            return entry["cumulative_us"] / 1000
+    return 0.0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Import-time breakdown of the DJ Library Manager CLI")
+    parser.add_argument("--module", default=DEFAULT_MODULE, help="Module to import (default: %(default)s)")
+    parser.add_argument("--runs", type=int, default=DEFAULT_RUNS, help="Fresh interpreters to time (default: %(default)s)")
+    parser.add_argument("--top", type=int, default=DEFAULT_TOP, help="Slowest imports to list (default: %(default)s)")
+    parser.add_argument("--budget-ms", type=float, default=None, help="Fail if the median import time exceeds this")
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+
+    runs = [measure_imports(args.module) for _ in range(max(args.runs, 1))]
+    totals = [total_ms(entries, args.module) for entries in runs]
+    median = statistics.median(totals)
+
+    # The last run has warm OS caches, like a normal launch
+    entries = runs[-1]
+
+    print(f"=== Import time: {args.module} ===")
+    print(f"Median over {len(totals)} runs: {median:.1f} ms (min {min(totals):.1f}, max {max(totals):.1f})")
+
+    print("\nSlowest imports (cumulative, last run):")
+    print(f"{'cumulative':>12}  {'self':>9}  module")
+    for entry in sorted(entries, key=lambda e: e["cumulative_us"], reverse=True)[:args.top]:
+        print(
+            f"{entry['cumulative_us'] / 1000:>9.1f} ms  {entry['self_us'] / 1000:>6.1f} ms  "
+            f"{'  ' * entry['depth']}{entry['module']}"
+        )
+
+    failed = False
+
+    heavy = heavy_imports(entries)
+    if heavy:
+        print(f"\nFAIL: heavy modules loaded at startup: {', '.join(heavy)}")
+        failed = True
+
+    if args.budget_ms is not None and median > args.budget_ms:
+        print(f"\nFAIL: {median:.1f} ms exceeds the {args.budget_ms:.1f} ms budget")
+        failed = True
+
+    if not failed:
+        print("\nOK: no heavy modules loaded at startup")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
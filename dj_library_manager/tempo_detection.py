@@ -0,0 +1,154 @@
+# tempo_detection.py
+#
+# Fast tempo estimation for DJ libraries.
+# Instead of beat-tracking the whole track, a few windows from the body
+# of the track are decimated to 11 kHz, reduced to a coarse onset
+# envelope (~43 frames/s) and autocorrelated. The strongest periodicity
+# is the tempo; its normalised autocorrelation is the confidence.
+# Octave errors are corrected by comparing the autocorrelation at the
+# tempo and at double tempo; only readings outside a wide plausible
+# range are folded, so 170+ BPM drum & bass keeps its real tempo.
+# Low-confidence tracks fall back to a full librosa beat track.
+
+import librosa
+import numpy as np
+
+from dj_library_manager.analysis import analysis_windows
+
+TEMPO_WINDOW_SECONDS = 15
+TEMPO_MAX_WINDOWS = 4
+
+DECIMATION = 2             # 22050 Hz -> 11025 Hz
+ONSET_HOP = 256            # ~43 onset frames per second at 11025 Hz
+ONSET_N_FFT = 1024
+ONSET_N_MELS = 40
+
+# Periodicities searched, before folding
+MIN_TEMPO = 60
+MAX_TEMPO = 200
+
+# Readings outside [low, high) are halved / doubled into it
+PLAUSIBLE_BPM_RANGE = (70, 180)
+
+# Double tempo is chosen when its autocorrelation peak is at least this
+# strong relative to the best peak: a steady pulse correlates almost
+# equally at every multiple of its period, so the faster reading wins
+# unless the slower one is clearly stronger
+OCTAVE_PREFERENCE = 0.9
+
+# Below this the windowed estimate is not trusted
+MIN_CONFIDENCE = 0.3
+
+
+def fold_tempo(bpm: float, bpm_range: tuple = PLAUSIBLE_BPM_RANGE) -> float:
+    """
+    Doubles or halves `bpm` until it lies in the plausible range.
+    """
+    low, high = bpm_range
+    while bpm < low:
+        bpm *= 2
+    while bpm >= high:
+        bpm /= 2
+    return bpm
+
+
+def autocorrelation_peak(ac, lag: float) -> tuple[float, float]:
+    """
+    The autocorrelation peak nearest `lag`, refined by parabolic
+    interpolation for sub-frame precision. Returns (lag, strength).
+    """
+    i = int(round(lag))
+    i = min(max(i, 2), len(ac) - 3)
+    i = i - 1 + int(np.argmax(ac[i - 1:i + 2]))
+
+    left, peak, right = ac[i - 1], ac[i], ac[i + 1]
+    curvature = left - 2 * peak + right
+    offset = 0.5 * (left - right) / curvature if curvature < 0 else 0.0
+    offset = float(np.clip(offset, -0.5, 0.5))
+
+    return i + offset, float(peak - 0.25 * (left - right) * offset)
+
+
+def choose_octave(ac, lag: float, strength: float, frame_rate: float) -> float:
+    """
+    BPM for the best lag, or double it when the double-tempo peak is
+    nearly as strong and still plausible.
+    """
+    bpm = 60 * frame_rate / lag
+
+    if bpm * 2 < PLAUSIBLE_BPM_RANGE[1]:
+        fast_lag, fast_strength = autocorrelation_peak(ac, lag / 2)
+        if fast_strength >= OCTAVE_PREFERENCE * strength:
+            return 60 * frame_rate / fast_lag
+
+    return bpm
+
+
+def onset_envelope(window, sr: int):
+    # Cheap 2x decimation (pairwise average) before the mel spectrogram
+    n = len(window) // DECIMATION * DECIMATION
+    y = window[:n].reshape(-1, DECIMATION).mean(axis=1)
+    sr = sr // DECIMATION
+
+    envelope = librosa.onset.onset_strength(
+        y=y, sr=sr, hop_length=ONSET_HOP, n_fft=ONSET_N_FFT, n_mels=ONSET_N_MELS
+    )
+    return envelope, sr / ONSET_HOP
+
+
+def estimate_tempo(samples, sr: int, max_windows: int = TEMPO_MAX_WINDOWS) -> dict | None:
+    """
+    Windowed, low-resolution tempo estimate.
+    Returns {"bpm": float, "confidence": 0..1}, or None without a usable pulse.
+    """
+    windows = analysis_windows(samples, sr, TEMPO_WINDOW_SECONDS, max_windows)
+
+    frame_rate = sr / DECIMATION / ONSET_HOP
+    min_lag = int(frame_rate * 60 / MAX_TEMPO)
+    max_lag = int(np.ceil(frame_rate * 60 / MIN_TEMPO)) + 1
+
+    # Average normalised autocorrelation over the windows
+    correlations = []
+    for window in windows:
+        envelope, frame_rate = onset_envelope(window, sr)
+        envelope = envelope - envelope.mean()
+
+        if len(envelope) <= max_lag + 1 or not np.any(envelope):
+            continue
+
+        ac = librosa.autocorrelate(envelope, max_size=max_lag + 2)
+        correlations.append(ac / ac[0])
+
+    if not correlations:
+        return None
+
+    ac = np.mean(correlations, axis=0)
+    lag, peak = autocorrelation_peak(ac, min_lag + int(np.argmax(ac[min_lag:max_lag])))
+
+    bpm = choose_octave(ac, lag, peak, frame_rate)
+
+    return {
+        "bpm": float(fold_tempo(bpm)),
+        "confidence": float(np.clip(peak, 0.0, 1.0)),
+    }
+
+
+def detect_tempo(samples, sr: int) -> dict | None:
+    """
+    Windowed estimate first; a full beat track when it isn't confident.
+    Returns {"bpm": float, "confidence": float | None, "method": "windowed" | "full"}.
+    """
+    estimate = estimate_tempo(samples, sr)
+    if estimate is not None and estimate["confidence"] >= MIN_CONFIDENCE:
+        return {**estimate, "method": "windowed"}
+
+    tempo, _ = librosa.beat.beat_track(y=samples, sr=sr)
+    bpm = float(np.atleast_1d(tempo)[0])
+    if bpm <= 0:
+        return None
+
+    return {
+        "bpm": fold_tempo(bpm),
+        "confidence": estimate["confidence"] if estimate else None,
+        "method": "full",
+    }
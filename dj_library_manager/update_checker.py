@@ -0,0 +1,199 @@
+# update_checker.py
+#
+# Tells the user when a newer release is on PyPI, without ever
+# delaying startup:
+# - the answer is cached on disk and reused for CHECK_INTERVAL (a day),
+#   so at most one request is made per day
+# - when the cache is stale, the request runs in a daemon thread and
+#   the notice is shown once it has finished; offline machines just
+#   never see one
+# - DJ_LIBRARY_NO_UPDATE_CHECK=1 (or --no-update-check) turns it off
+# - DJ_LIBRARY_UPDATE_URL points it at another index (e.g. a local
+#   test server)
+
+import json
+import os
+import threading
+import time
+import urllib.request
+from importlib.metadata import version, PackageNotFoundError
+
+from dj_library_manager import __version__
+
+PACKAGE_NAME = "uteeya-dj-tools"
+PYPI_URL = f"https://pypi.org/pypi/{PACKAGE_NAME}/json"
+
+CHECK_INTERVAL = 24 * 60 * 60      # seconds between requests
+REQUEST_TIMEOUT = 2
+
+DISABLE_ENV = "DJ_LIBRARY_NO_UPDATE_CHECK"
+URL_ENV = "DJ_LIBRARY_UPDATE_URL"
+
+
+def updates_disabled() -> bool:
+    return os.environ.get(DISABLE_ENV, "").strip().lower() not in ("", "0", "false", "no")
+
+
+def default_cache_path() -> str:
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "dj_library_manager", "update_check.json")
+
+
+def installed_version() -> str:
+    try:
+        return version(PACKAGE_NAME)
+    except PackageNotFoundError:
+        return __version__
+
+
+def parse_version(text: str) -> tuple:
+    # "1.10.2" -> (1, 10, 2); stops at the first non-numeric part ("1.2rc1" -> (1,))
+    parts = []
+    for part in text.split("."):
+        if not part.isdigit():
+            break
+        parts.append(int(part))
+    return tuple(parts)
+
+
+def is_newer(latest: str, installed: str) -> bool:
+    latest_parts, installed_parts = parse_version(latest), parse_version(installed)
+    if latest_parts and installed_parts:
+        return latest_parts > installed_parts
+    return latest != installed
+
+
+# ============================================================
+# Disk cache: {"checked_at": unix time, "latest": "1.2.3" or null}
+# ============================================================
+def read_cache(path: str) -> dict | None:
+    try:
+        with open(path, encoding="utf-8") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    return cache if isinstance(cache, dict) else None
+
+
+def write_cache(path: str, latest: str | None):
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"checked_at": time.time(), "latest": latest}, f)
+        os.replace(tmp_path, path)
+    except OSError:
+        pass
+
+
+def cache_is_fresh(cache: dict | None, now: float | None = None) -> bool:
+    if not cache:
+        return False
+
+    checked_at = cache.get("checked_at")
+    if not isinstance(checked_at, (int, float)):
+        return False
+
+    now = time.time() if now is None else now
+    return 0 <= now - checked_at < CHECK_INTERVAL
+
+
+# ============================================================
+# Check
+# ============================================================
+def fetch_latest_version(url: str, timeout: float = REQUEST_TIMEOUT) -> str | None:
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            data = json.loads(response.read().decode())
+        return data["info"]["version"]
+    except Exception:
+        # No internet, index down, unexpected payload
+        return None
+
+
+def check_for_updates(url: str | None = None, cache_path: str | None = None,
+                      timeout: float = REQUEST_TIMEOUT) -> str | None:
+    """
+    Latest released version if it's newer than the installed one.
+    Uses the cached answer while it's fresh; otherwise asks the index
+    (blocking) and caches the answer. Failures are cached too, so an
+    offline machine retries at most once a day; they keep the last
+    version that was seen.
+    """
+    cache_path = cache_path or default_cache_path()
+    cache = read_cache(cache_path)
+
+    if cache_is_fresh(cache):
+        latest = cache.get("latest")
+    else:
+        latest = fetch_latest_version(url or os.environ.get(URL_ENV) or PYPI_URL, timeout)
+        if latest is None and cache:
+            latest = cache.get("latest")
+        write_cache(cache_path, latest)
+
+    if latest and is_newer(latest, installed_version()):
+        return latest
+    return None
+
+
+class UpdateCheck:
+    """
+    check_for_updates() on a daemon thread. notice() never blocks:
+    it returns the message once the check has finished, else None.
+    """
+
+    def __init__(self, url: str | None = None, cache_path: str | None = None):
+        self.latest = None
+        self._thread = threading.Thread(
+            target=self._run, args=(url, cache_path), name="update-check", daemon=True
+        )
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self, url, cache_path):
+        self.latest = check_for_updates(url, cache_path)
+
+    def done(self) -> bool:
+        return not self._thread.is_alive()
+
+    def notice(self) -> str | None:
+        if not self.done() or not self.latest:
+            return None
+
+        return (
+            f"Update available: {installed_version()} → {self.latest}\n"
+            f"Run: pip install --upgrade {PACKAGE_NAME}"
+        )
+
+
+def show_update_notice(check: UpdateCheck | None) -> bool:
+    """
+    Prints the notice if the check has found an update.
+    Returns True once the check is finished (shown or not).
+    """
+    if check is None:
+        return True
+    if not check.done():
+        return False
+
+    message = check.notice()
+    if message:
+        from rich.console import Console
+        from rich.text import Text
+
+        Console().print(Text(message, style="bold yellow"))
+
+    return True
+
+
+def start_update_check(enabled: bool = True) -> UpdateCheck | None:
+    """
+    Starts the background check unless disabled by the caller or
+    DJ_LIBRARY_NO_UPDATE_CHECK. Returns None when skipped.
+    """
+    if not enabled or updates_disabled():
+        return None
+    return UpdateCheck().start()
@@ -0,0 +1,171 @@
+# walker.py
+#
+# Streaming directory walker for scans.
+# - os.scandir based, yields (path, size, mtime_ns)
+# - stable sorted order, so a scan can resume after a checkpoint path
+# - no up-front file list: results stream out while the walk runs
+# - WalkFeed runs the walk in a background thread so scanning starts
+#   immediately and the total is counted as we go
+
+import os
+import queue
+import threading
+
+SUPPORTED_EXTENSIONS = {".mp3", ".wav", ".flac", ".m4a", ".aac"}
+
+
+def is_audio_file(filepath: str) -> bool:
+    _, ext = os.path.splitext(filepath.lower())
+    return ext in SUPPORTED_EXTENSIONS
+
+
+def mtime_seconds(mtime_ns: int) -> int:
+    # scanned_files stores whole seconds, as int(os.path.getmtime()) did
+    return mtime_ns // 1_000_000_000
+
+
+# ============================================================
+# Generator walker
+# ============================================================
+def walk_key(root: str, path: str) -> tuple:
+    # Walk order: path components relative to root, compared in turn
+    relative = os.path.relpath(path, root)
+    return () if relative == os.curdir else tuple(relative.split(os.sep))
+
+
+def walk_audio_files(root: str, start_after: str | None = None, unreadable: set | None = None):
+    """
+    Yields (path, size, mtime_ns) for every audio file under `root`,
+    in a stable sorted order (entries by name, depth first).
+    With `start_after`, everything up to and including that path is
+    skipped without being listed or stat'ed, so a scan can resume
+    from a checkpoint.
+    Unreadable directories and files are skipped, like os.walk does;
+    pass an `unreadable` set to collect their paths.
+    """
+    after = walk_key(root, start_after) if start_after else None
+    stack = [(root, None)]
+
+    while stack:
+        path, file_entry = stack.pop()
+
+        if file_entry is not None:
+            try:
+                st = file_entry.stat()
+            except OSError:
+                if unreadable is not None:
+                    unreadable.add(path)
+                continue
+            yield path, st.st_size, st.st_mtime_ns
+            continue
+
+        try:
+            with os.scandir(path) as entries:
+                children = []
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            children.append((entry.name, entry.path, None))
+                        elif entry.is_file() and is_audio_file(entry.name):
+                            children.append((entry.name, entry.path, entry))
+                    except OSError:
+                        if unreadable is not None:
+                            unreadable.add(entry.path)
+                        continue
+        except OSError:
+            if unreadable is not None:
+                unreadable.add(path)
+            continue
+
+        # Reverse so entries come off the stack in name order
+        children.sort(key=lambda child: child[0], reverse=True)
+
+        for _, child, child_entry in children:
+            if after is not None:
+                key = walk_key(root, child)
+                if child_entry is None:
+                    # Every file below a directory sorting before the
+                    # checkpoint (and not containing it) was already done
+                    if key < after and after[:len(key)] != key:
+                        continue
+                elif key <= after:
+                    continue
+
+            stack.append((child, child_entry))
+
+
+# ============================================================
+# Background feed
+# ============================================================
+_DONE = object()
+
+
+class WalkFeed:
+    """
+    Walks `root` in a background thread.
+    Iterate over the feed to receive (path, size, mtime_ns) entries;
+    `found` and `done` describe the walk's progress so far, `seen`
+    holds every path walked (for pruning files that have gone) and
+    `unreadable` the directories and files the walk couldn't read.
+    """
+
+    def __init__(self, root: str, max_buffered: int = 10000, start_after: str | None = None):
+        self.root = root
+        self.start_after = start_after
+        self.found = 0
+        self.done = False
+        self.seen = set()
+        self.unreadable = set()
+
+        self._queue = queue.Queue(maxsize=max_buffered)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            for item in walk_audio_files(self.root, self.start_after, self.unreadable):
+                self.found += 1
+                self.seen.add(item[0])
+                if not self._put(item):
+                    return
+        finally:
+            self.done = True
+            self._put(_DONE)
+
+    def _put(self, item) -> bool:
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def __iter__(self):
+        while True:
+            item = self._queue.get()
+            if item is _DONE:
+                return
+            yield item
+
+    def stop(self):
+        self._stop.set()
+
+
+class FileListFeed:
+    """
+    Feeds a known list of (path, size, mtime_ns) entries through the
+    same interface as WalkFeed (e.g. files waiting in the analysis queue).
+    """
+
+    def __init__(self, entries: list):
+        self.entries = entries
+        self.found = len(entries)
+        self.done = True
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def stop(self):
+        pass